@@ -0,0 +1,371 @@
+# Program: bench.py
+# Author: Tom Alexa
+
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import dbapp
+
+##############
+#  contants  #
+##############
+
+SIZES = (10_000, 100_000, 1_000_000)
+NUMBERS_PER_CONTACT = 2
+SEED = 1
+REPEAT = 5
+THRESHOLD = 1.2     # median slower by more than 20 % → regression
+BENCH_DIR = Path(tempfile.gettempdir()) / "contactdb-bench"
+
+# czech names → (male, female), the first ones are the most common
+FIRST_NAMES = (
+    ("Jiří", "Jana"), ("Jan", "Marie"), ("Petr", "Eva"), ("Josef", "Hana"), ("Pavel", "Anna"),
+    ("Martin", "Lenka"), ("Tomáš", "Kateřina"), ("Jaroslav", "Lucie"), ("Miroslav", "Věra"), ("Zdeněk", "Alena"),
+    ("Václav", "Petra"), ("Michal", "Veronika"), ("František", "Jaroslava"), ("Jakub", "Tereza"), ("Milan", "Martina"),
+    ("Karel", "Michaela"), ("Lukáš", "Jitka"), ("David", "Helena"), ("Vladimír", "Ludmila"), ("Ondřej", "Zdeňka"),
+    ("Ladislav", "Ivana"), ("Roman", "Monika"), ("Marek", "Eliška"), ("Stanislav", "Zuzana"), ("Daniel", "Markéta"),
+)
+LAST_NAMES = (
+    ("Novák", "Nováková"), ("Svoboda", "Svobodová"), ("Novotný", "Novotná"), ("Dvořák", "Dvořáková"),
+    ("Černý", "Černá"), ("Procházka", "Procházková"), ("Kučera", "Kučerová"), ("Veselý", "Veselá"),
+    ("Horák", "Horáková"), ("Němec", "Němcová"), ("Pokorný", "Pokorná"), ("Marek", "Marková"),
+    ("Pospíšil", "Pospíšilová"), ("Hájek", "Hájková"), ("Jelínek", "Jelínková"), ("Král", "Králová"),
+    ("Růžička", "Růžičková"), ("Beneš", "Benešová"), ("Fiala", "Fialová"), ("Sedláček", "Sedláčková"),
+    ("Doležal", "Doležalová"), ("Zeman", "Zemanová"), ("Kolář", "Kolářová"), ("Navrátil", "Navrátilová"),
+    ("Čermák", "Čermáková"), ("Urban", "Urbanová"), ("Vaněk", "Vaňková"), ("Blažek", "Blažková"),
+    ("Kříž", "Křížová"), ("Kovář", "Kovářová"),
+)
+CITIES = (
+    "Praha", "Brno", "Ostrava", "Plzeň", "Liberec", "Olomouc", "České Budějovice",
+    "Hradec Králové", "Ústí nad Labem", "Pardubice", "Zlín", "Havířov", "Kladno", "Most",
+)
+STREETS = (
+    "Hlavní", "Nádražní", "Školní", "Zahradní", "Husova", "Masarykova", "Palackého",
+    "Komenského", "Dlouhá", "Krátká", "Lipová", "Polní", "Luční", "Jiráskova",
+)
+# groups besides the default ones (family, friends, work)
+GROUPS = ("family", "friends", "work", "school", "sport", "neighbours", "doctors", "club")
+PREFIXES = (
+    (420, "CZ"), (421, "SK"), (49, "DE"), (43, "AT"), (48, "PL"),
+    (36, "HU"), (44, "GB"), (1, "US"), (33, "FR"), (39, "IT"),
+)
+
+
+###############
+#  generator  #
+###############
+
+def zipf_weights(count):
+    """
+    Return: weights of skewed distribution → the first value is the most common
+    """
+    return [1 / rank for rank in range(1, count + 1)]
+
+
+def generate_contacts(count, seed=SEED):
+    """
+    Rows of contacts with czech names, skewed groups, cities and mostly known date of birth
+    """
+    rng = random.Random(seed)
+    first_weights = zipf_weights(len(FIRST_NAMES))
+    last_weights = zipf_weights(len(LAST_NAMES))
+    group_weights = zipf_weights(len(GROUPS))
+    city_weights = zipf_weights(len(CITIES))
+    first_day = datetime.date(1940, 1, 1).toordinal()
+    last_day = datetime.date(2010, 12, 31).toordinal()
+    for i in range(1, count + 1):
+        female = rng.random() < 0.5
+        first_name = rng.choices(FIRST_NAMES, first_weights)[0][female]
+        last_name = rng.choices(LAST_NAMES, last_weights)[0][female]
+        date_of_birth = None
+        if rng.random() < 0.95:
+            date_of_birth = datetime.date.fromordinal(rng.randint(first_day, last_day)).isoformat()
+        yield {
+            "id": i,
+            "first_name": first_name,
+            "last_name": last_name,
+            "date_of_birth": date_of_birth,
+            "group": rng.choices(GROUPS, group_weights)[0] if rng.random() < 0.8 else None,
+            "street": rng.choice(STREETS),
+            "number_of_descriptive": rng.randint(1, 200),
+            "city": rng.choices(CITIES, city_weights)[0],
+        }
+
+
+def generate_numbers(contacts, per_contact=NUMBERS_PER_CONTACT, seed=SEED):
+    """
+    Rows of phone numbers → given number for every contact, most of them czech
+    """
+    rng = random.Random(seed + 1)
+    prefix_weights = [weight * weight for weight in zipf_weights(len(PREFIXES))]
+    for contact_id in range(1, contacts + 1):
+        for _ in range(per_contact):
+            yield {
+                "prefix": rng.choices(PREFIXES, prefix_weights)[0][0],
+                "number": rng.randint(600_000_000, 799_999_999),
+                "contact_id": contact_id,
+            }
+
+
+def database_path(directory, contacts, per_contact, seed):
+    return Path(directory) / f"bench-{contacts}-{per_contact}-{seed}.db"
+
+
+def create_database(path, contacts, per_contact=NUMBERS_PER_CONTACT, seed=SEED):
+    """
+    Create the benchmark database (a database with the same size and seed is reused)
+    Return: seconds spent on generating
+    """
+    if path.exists():
+        return 0.0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(".tmp")
+    journal = (Path(f"{temporary}-wal"), Path(f"{temporary}-shm"))
+    for leftover in (temporary, *journal):
+        leftover.unlink(missing_ok=True)
+    start = time.perf_counter()
+    db = dbapp.ContactDatabase(temporary, "bulk-load")
+    db.insert_many("contact_group", [{"name": name} for name in GROUPS if not db.group_id(name)])
+    db.insert_many("prefix", [{"prefix": prefix, "state": state} for prefix, state in PREFIXES])
+    db.import_rows("contact", generate_contacts(contacts, seed))
+    db.import_rows("phone_number", generate_numbers(contacts, per_contact, seed))
+    db.analyze()
+    with db.writing() as cursor:
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    db.close()
+    # close() checkpoints and removes them, anything left would be orphaned by the rename
+    if any(leftover.exists() for leftover in journal):
+        raise RuntimeError(f"{temporary} was not closed cleanly, its -wal/-shm files are left")
+    temporary.rename(path)
+    return time.perf_counter() - start
+
+
+################
+#  benchmarks  #
+################
+
+def measure(function, repeat, setup=None):
+    """
+    Call function repeatedly, setup is called before every call and is not measured
+    Return: dict of timings in ms
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(times), 4),
+        "median_ms": round(statistics.median(times), 4),
+        "mean_ms": round(statistics.fmean(times), 4),
+    }
+
+
+def new_data(output_format="table"):
+    """
+    Return: empty data of one 'l' command (as App.show creates it)
+    """
+    return {"data": [], "name": "", "input": "", "chosen": "", "valid": True, "page_size": None, "paging": None, "format": output_format}
+
+
+def sample(db):
+    """
+    Pick parameters of the benchmarks from the database → every search finds something
+    Return: dict
+    """
+    db.cursor.execute("SELECT last_name FROM contact GROUP BY last_name ORDER BY COUNT(*) DESC LIMIT 1;")
+    last_name = db.cursor.fetchone()[0]
+    db.cursor.execute("SELECT CAST(number AS TEXT) FROM phone_number ORDER BY id LIMIT 1;")
+    number = db.cursor.fetchone()[0]
+    return {
+        "name": last_name,
+        "name_contains": last_name[:4],
+        "name_typo": last_name[:2] + last_name[3:],
+        "number": number,
+    }
+
+
+def bench_modes(app, parameters, repeat):
+    """
+    Time every App.mode_* path (without printing) with empty result cache
+    """
+    db = app._db
+    cases = {
+        "mode_name exact": lambda: app.mode_name(new_data(), parameters["name"]),
+        "mode_name contains": lambda: app.mode_name(new_data(), parameters["name_contains"]),
+        "mode_name typo": lambda: app.mode_name(new_data(), parameters["name_typo"]),
+        "mode_table contact": lambda: app.mode_table(new_data(), "contact"),
+        "mode_table group": lambda: app.mode_table(new_data(), "group"),
+        "mode_group": lambda: app.mode_group(new_data(), "work"),
+        "mode_group similar": lambda: app.mode_group(new_data(), "wor"),
+        "mode_number contains": lambda: app.mode_number(new_data(), parameters["number"][3:7]),
+        "mode_number starts": lambda: app.mode_number(new_data(), parameters["number"][:5] + "*"),
+        "mode_number ends": lambda: app.mode_number(new_data(), "*" + parameters["number"][-5:]),
+        "mode_number prefix": lambda: mode_number_prefix(app, "+421", parameters["number"][:4] + "*"),
+        "mode_date year": lambda: app.mode_date(new_data(), "1980//"),
+        "mode_date day": lambda: app.mode_date(new_data(), "//11"),
+        "mode_birthday": lambda: app.mode_birthday(new_data(), "30"),
+    }
+    return {name: measure(case, repeat, db.results.clear) for name, case in cases.items()}
+
+
+def mode_number_prefix(app, prefix, digits):
+    """
+    'l -n +421 1234*' → the prefix and the digits are two parameters of mode_number
+    """
+    data = new_data()
+    if not app.mode_number(data, prefix):
+        app.mode_number(data, digits)
+
+
+def bench_database(db, parameters, repeat):
+    """
+    Time select, insert, update and delete of ContactDatabase
+    """
+    results = {
+        "select exact": measure(lambda: db.select("contact", {"last_name": parameters["name"]}), repeat, db.results.clear),
+        "select similar": measure(lambda: db.select("contact", {"last_name": parameters["name_typo"]}), repeat, db.results.clear),
+    }
+    ids = []
+    contact = {"first_name": "Benchmark", "last_name": "Test", "date_of_birth": "2000-01-01", "group_id": 1, "city": "Praha"}
+    results["insert"] = measure(lambda: ids.append(db.insert("contact", contact)), repeat)
+    updates = iter(list(ids))
+    results["update"] = measure(lambda: db.update("contact", {"city": "Brno"}, next(updates)), repeat)
+    deletes = iter(list(ids))
+    results["delete"] = measure(lambda: db.delete("contact", next(deletes)), repeat)
+    return results
+
+
+def bench_print(app, repeat):
+    """
+    Time print_table of the whole contact listing in every output format (written to os.devnull)
+    """
+    data = new_data()
+    app.mode_table(data, "contact")
+    results = {}
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        for output_format in dbapp.OUTPUT_FORMATS:
+            data["format"] = output_format
+            results[f"print_table {output_format}"] = measure(lambda: app.print_table(data, name="all contact"), repeat)
+    return results
+
+
+def run(arguments):
+    """
+    Generate databases and run all benchmarks for every size
+    Return: results (dict ready for json)
+    """
+    results = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": arguments.seed,
+        "numbers_per_contact": arguments.numbers,
+        "repeat": arguments.repeat,
+        "sizes": {},
+    }
+    for size in arguments.sizes:
+        path = database_path(arguments.dir, size, arguments.numbers, arguments.seed)
+        print(f"{size} contacts: generating {path}", file=sys.stderr)
+        generated = create_database(path, size, arguments.numbers, arguments.seed)
+        app = dbapp.App(dbapp.LANGUAGE, path, interactive=False)
+        parameters = sample(app._db)
+        print(f"{size} contacts: running benchmarks", file=sys.stderr)
+        timings = {}
+        timings.update(bench_modes(app, parameters, arguments.repeat))
+        timings.update(bench_database(app._db, parameters, arguments.repeat))
+        timings.update(bench_print(app, arguments.repeat))
+        app.close()
+        results["sizes"][str(size)] = {"generate_s": round(generated, 2), "parameters": parameters, "timings": timings}
+    return results
+
+
+def git_commit():
+    """
+    Return: current git commit of the application or None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+###########
+#  print  #
+###########
+
+def print_results(results, baseline=None, threshold=THRESHOLD):
+    """
+    Print median times, with baseline also the ratio to it
+    Return: number of regressions (median slower than threshold × baseline)
+    """
+    regressions = 0
+    for size, result in results["sizes"].items():
+        print(f"\n{size} contacts")
+        old = (baseline or {}).get("sizes", {}).get(size, {}).get("timings", {})
+        for name, timing in result["timings"].items():
+            line = f"  {name: <22} {timing['median_ms']: >12.3f} ms"
+            if name in old and old[name]["median_ms"] > 0:
+                ratio = timing["median_ms"] / old[name]["median_ms"]
+                line += f"  {ratio: >6.2f}×"
+                if ratio > threshold:
+                    line += "  slower!"
+                    regressions += 1
+            print(line)
+    return regressions
+
+
+#################
+#  main script  #
+#################
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the contact database")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=SIZES, help="numbers of contacts")
+    parser.add_argument("-n", "--numbers", type=int, default=NUMBERS_PER_CONTACT, help="phone numbers of every contact")
+    parser.add_argument("-r", "--repeat", type=int, default=REPEAT, help="runs of every benchmark")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--dir", default=BENCH_DIR, help="directory for generated databases (they are reused)")
+    parser.add_argument("-o", "--output", help="save results as json")
+    parser.add_argument("-c", "--compare", help="json with results of the previous version")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD, help="ratio of medians reported as regression")
+    return parser.parse_args(arguments)
+
+
+def main():
+    arguments = parse_arguments()
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+    results = run(arguments)
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    regressions = print_results(results, baseline, arguments.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,31 @@
 # Author: Tom Alexa
 
 
+import argparse
+import array
+import bisect
+import collections
+import cProfile
+import contextlib
+import csv
+import datetime
+import functools
+import itertools
+import json
+import math
+import os
+import re
 import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import weakref
+import zlib
 from pathlib import Path
 
+# asyncio and concurrent.futures are imported by AsyncContactDatabase only → about 40 ms less for every start
+
 ##############
 #  contants  #
 ##############
@@ -15,6 +37,198 @@ LANGUAGE = "cz"
 DB_PATH = "database/"
 DB_NAME = "contacts.db"
 
+# sqlite prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# connection profiles → how much durability is traded for write speed
+# chosen by --durability, environment variable CONTACTDB_DURABILITY or DURABILITY
+DURABILITY = "balanced"
+DURABILITY_PROFILES = {
+    # every commit is on the disk before it returns
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,       # KiB
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,       # ms
+    },
+    # commits can be lost on power failure, but the database is never corrupted
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # no syncing at all → only for loading data that can be loaded again
+    "bulk-load": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+# id → name resolution cache
+NAME_CACHE_SIZE = 4096
+
+# query result cache
+RESULT_CACHE_SIZE = 256         # cached queries
+RESULT_CACHE_MAX_ROWS = 10000   # bigger results are not cached
+
+# query statistics and slow query log → off by default (about 5 µs per statement), turned on by --stats,
+# --slow-ms, --slow-log or profiling, environment variables CONTACTDB_SLOW_MS / CONTACTDB_SLOW_LOG set the threshold and the log
+QUERY_STATS = False
+SLOW_QUERY_MS = 100.0
+SLOW_QUERY_LOG = None           # file for slow queries (json lines), None → kept in memory only
+STATEMENT_SHAPES = 1024         # remembered sql → shape translations
+
+# profiling of App commands → --profile / --profile-dump, environment variable CONTACTDB_PROFILING (1 or file)
+PROFILE_COLLAPSED = (".folded", ".collapsed", ".txt")  # dump suffixes for collapsed stacks, other → pstats
+
+# threads of AsyncContactDatabase
+ASYNC_WORKERS = 4
+
+# import
+IMPORT_BATCH_SIZE = 10000
+FILE_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# export
+EXPORT_CHUNK_SIZE = 1000
+
+# listing
+PAGE_SIZE = 20
+OUTPUT_FORMATS = ("table", "tsv", "json")
+
+
+##############
+#  messages  #
+##############
+
+# texts of the user interface → built for the language in use on the first App only
+MESSAGES = {}
+
+
+def load_messages(language):
+    """
+    Texts of the user interface in given language, table headers come with precomputed column widths
+    Return: dict of texts shared by all Apps
+    """
+    if language not in MESSAGES:
+        messages = MESSAGE_BUILDERS[language]()
+        for value in messages.values():
+            if isinstance(value, dict) and "columns" in value:
+                value["widths"] = tuple(len(f" {column} ") for column in value["columns"])
+        MESSAGES[language] = messages
+    return MESSAGES[language]
+
+
+def messages_cz():
+    dash = "-"
+    space = " "
+    comma = "."
+
+    dash_options = dash * 80
+    spaces_options = space * 6
+
+    return {
+        "input": f"{space*4}Vyber jednu z možností: ",
+        "page": f"{space*4}[n] další stránka, [p] předchozí stránka, [q] zpět: ",
+        "options": f"{spaces_options}{dash_options}\n{spaces_options}| H {comma*16} ukáže tuto tabulku{space*40}|\n{spaces_options}| L (jméno) {comma*8} ukáže kontakt podle jména nebo podobné kontakty{space*11}|\n{spaces_options}| L -n (číslo) {comma*5} ukáže kontakty podle čísla nebo podobné kontakty{space*10}|\n{spaces_options}| L -g (skupina) {comma*3} ukáže kontakty ve skupině{space*33}|\n{spaces_options}| L -t (tabulka) {comma*3} ukáže všechny řádky v tabulce{space*29}|\n{spaces_options}| L -d (datum) {comma*5} ukáže kontakty podle data narození → formát: YYYY/MM/DD{space*3}|\n{spaces_options}|{space*60}den: //DD{space*9}|\n{spaces_options}|{space*58}měsíc: /MM/{space*9}|\n{spaces_options}|{space*60}rok: YYYY//{space*7}|\n{spaces_options}| L -b (dny) {comma*7} ukáže kontakty s narozeninami v příštích dnech{space*12}|\n{spaces_options}| L -p (počet) {comma*5} vypíše kontakty po stránkách s daným počtem řádků{space*9}|\n{spaces_options}| L -f (formát) {comma*4} výstup ve formátu table, tsv nebo json{space*20}|\n{spaces_options}| L --stats {comma*8} ukáže statistiky dotazů (spuštěné s --stats){space*14}|\n{spaces_options}| I {comma*16} vloží kontakt do tabulky{space*34}|\n{spaces_options}| I (tabulka) {comma*6} vloží řádek do tabulky{space*36}|\n{spaces_options}| D {comma*16} odstraní kontakt{space*42}|\n{spaces_options}| D (tabulka) {comma*6} odstraní řádek z tabulky{space*34}|\n{spaces_options}| U {comma*16} uprav kontakt{space*45}|\n{spaces_options}| U (tabulka) {comma*6} uprav řádek z tabulky{space*37}|\n{spaces_options}| Q {comma*16} ukončí aplikaci{space*43}|\n{spaces_options}{dash_options}",
+        "wrong": f"{space*6}Příkaz *?* neexistuje!\n",
+        "failed": f"{space*6}Příkaz *?* selhal:",
+        "all contact": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Jméno", "Příjmení", "Datum narození", "Skupina", "Ulice", "Číslo popisné", "Město"],
+        },
+        "all contact_group": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Skupina"],
+        },
+        "all prefix": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Předčíslí", "Stát"],
+        },
+        "all phone_number": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Předčíslí", "Číslo", "Kontakt"],
+        },
+        "all stats": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Příkaz", "Počet", "Celkem ms", "Průměr ms", "Max ms", "Řádků", "Pomalých", "Histogram"],
+            "keys": QueryStats.COLUMNS,
+        },
+        "stats": f"{space*6}Příkazů: {{queries}}, celkem {{total_ms}} ms, pomalých (≥ {{slow_ms:g}} ms): {{slow}}",
+        "no stats": f"{space*6}Statistiky dotazů jsou vypnuté, zapni je přepínačem --stats!",
+        "read only": f"{space*6}Databáze je načtená jen pro čtení, nic nelze měnit!\n",
+        "no parameter": f"{space*6}Pro *?* chybí parameter!",
+        "parameter": f"{space*6}Parameter *?* neexistuje!",
+        "table": f"{space*6}Tabulka *?* neexistuje!\n{space*6}Zkus 'contact', 'group', 'number', 'prefix'.",
+        "not number": f"{space*6}Parameter *?* není číslo!",
+        "no page": f"{space*6}Další stránka už není!\n",
+        "format": f"{space*6}Formát *?* neexistuje!\n{space*6}Zkus 'table', 'tsv', 'json'.",
+        "split date": f"{space*6}Datum je zadané ve špatném formátu!",
+        "non-numerical date": f"{space*6}Datum musí být zadané v číselném formátu!",
+    }
+
+
+def messages_en():
+    dash = "-"
+    space = " "
+    comma = "."
+
+    dash_options = dash * 80
+
+    return {
+        "input": f"{space*4}Choose one option: ",
+        "page": f"{space*4}[n] next page, [p] previous page, [q] back: ",
+        "options": f"{dash_options}\nH {comma*20} show this table\nL {comma*20} list all contacts\nL (contact name) ... show contact with given name or similar ones\nL -n (number) ... show contacts with given number or similar\nL -g (group) ... show contacts within group\nL -t (table) ... show all rows in a table\nL -d (date) ... show contacts that date of birth matches with given date → format: YYYY-MM-DD\n{space*78}day: --DD\n{space*76}month: -MM-\n{space*77}year: YYYY--\nL -b (days) ... show contacts with birthday in the next given number of days\nL -p (rows) ... show the listing in pages with given number of rows\nL -f (format) ... output format → table, tsv or json\nL --stats ... show statistics of executed statements (started with --stats)\nI ... insert row into contact table\nI -t (table) ... insert row into table\nD ... delete row from contact table\nD -t (table) ... delete row from table\nQ ... quit the application\n{dash*20}",
+        "wrong": f"{space*6}Bash *?* does not exists!\n",
+        "failed": f"{space*6}Command *?* failed:",
+        "all contact": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "First name", "Last name", "Date of birth", "Group", "Street", "Number of descriptive", "City"],
+        },
+        "all contact_group": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Group"],
+        },
+        "all prefix": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Prefix", "State"],
+        },
+        "all phone_number": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Prefix", "Number", "Contact"],
+        },
+        "all stats": {
+            "spaces": f"{space*6}",
+            "columns": ["ID", "Statement", "Count", "Total ms", "Mean ms", "Max ms", "Rows", "Slow", "Histogram"],
+            "keys": QueryStats.COLUMNS,
+        },
+        "stats": f"{space*6}Statements: {{queries}}, total {{total_ms}} ms, slow (≥ {{slow_ms:g}} ms): {{slow}}",
+        "no stats": f"{space*6}Query statistics are off, turn them on with --stats!",
+        "read only": f"{space*6}The database is loaded read-only, nothing can be changed!\n",
+        "no parameter": "no parameter",
+        "parameter": "wrong parameter",
+        "table": "wrong table",
+        "not number": "not number",
+        "no page": f"{space*6}There is no other page!\n",
+        "format": f"{space*6}Format *?* does not exist! Try 'table', 'tsv', 'json'.",
+        "split date": f"{space*6}Not a right format for a date!",
+        "non-numerical date": f"{space*6}Not a right format for a date!",
+    }
+
+
+MESSAGE_BUILDERS = {
+    "cz": messages_cz,
+    "en": messages_en,
+}
+
 
 #########
 #  App  #
@@ -29,12 +243,18 @@ class App:
         "d": ("d", "delete"),
         "h": ("h", "help")
     }
+    # options that do not ask any questions → the only ones allowed in batch mode
+    BATCH_OPTIONS = ("q", "l", "h")
     PARAMETERS = {
         "l": {
             "table": ("-t", "--table"),
             "group": ("-g", "--group"),
             "number": ("-n", "--number"),
             "date": ("-d", "--date"),
+            "birthday": ("-b", "--birthday"),
+            "page_size": ("-p", "--page-size"),
+            "format": ("-f", "--format"),
+            "stats": ("--stats",),
         },
         "i": {
             "phone_number": ("phone_number", "number", "n")
@@ -47,10 +267,15 @@ class App:
         "contact_group": ("contact_group", "contact_groups", "group", "groups", "g")
     }
 
-    def __init__(self, language):
+    def __init__(self, language, db_path=None, durability=None, output_format="table", interactive=True, query_stats=None, snapshot=False):
         self._language = language
-        self.load_print_constants()
-        self._db = ContactDatabase()
+        self.messages = load_messages(language)
+        if snapshot:
+            self._db = ContactSnapshot(db_path)
+        else:
+            self._db = ContactDatabase(db_path, durability, query_stats)
+        self.output_format = output_format
+        self.interactive = interactive
         self.running = True
 
     ##########
@@ -68,33 +293,85 @@ class App:
         self.close()
 
 
+    def run_batch(self, lines):
+        """
+        Run commands one per line (same format as in the interactive mode) without any banner or prompt,
+        empty lines and lines starting with '#' are skipped
+        Return: number of commands that failed
+        """
+        failed = 0
+        for line in lines:
+            if not self.running:
+                break
+            command = self.parse_command(line)
+            if command is None or command[0].startswith("#"):
+                continue
+            option, parameters = command
+            if not any(option in self.OPTIONS[name] for name in self.BATCH_OPTIONS):
+                self.wrong_command(option)
+                failed += 1
+                continue
+            failed += self.run_command(option, parameters)
+        return failed
+
+
+    def run_command(self, option, parameters):
+        """
+        Run one command without the interactive prompt, an error fails only this command
+        (it is printed to standard error, a closed standard output is left to the caller)
+        Return: True if the command failed
+        """
+        try:
+            data = self.manage_option(option, parameters)
+        except BrokenPipeError:
+            raise
+        except Exception as error:
+            command = " ".join((option, *parameters))
+            print(self.messages["failed"].replace("*?*", f"'{command}'"), f"{type(error).__name__}: {error}", file=sys.stderr)
+            return True
+        return data is not None and not data["valid"]
+
+
     def get_option(self):
         """
         Input format: 'option' 'parameter' 'parameter', ex. l -t contact
         Return: option, parameters (ex. 'l', ['-t', 'contact'])
         """
         while True:
-            command = list(filter(None, input(self.TO_PRINT["input"][self._language]).strip().split(" ")))
-            if not command:
+            command = self.parse_command(input(self.messages["input"]))
+            if command is None:
                 continue
-            option = command[0].lower()
-            parameters = list(map(lambda c: c.strip(), command[1:]))
+            option, parameters = command
             if not self.valid_option(option):
                 self.wrong_command(option)
                 continue
             return option, parameters
 
 
+    def parse_command(self, command):
+        """
+        Split one command into option and parameters
+        Return: option, parameters or None for an empty command
+        """
+        command = command.split()
+        if not command:
+            return None
+        return command[0].lower(), command[1:]
+
+
     def manage_option(self, option, parameters):
         """
         Manage user input and do something
+        Return: data of the listing for option 'L', otherwise None
         """
         if option in self.OPTIONS["q"]:     # quit
             self.running = False
         elif option in self.OPTIONS["h"]:   # help
             self.print_options()
         elif option in self.OPTIONS["l"]:   # list
-            self.show(parameters)
+            return self.show(parameters)
+        elif self._db.read_only and any(option in self.OPTIONS[name] for name in ("i", "u", "d")):
+            print(self.messages["read only"])
         elif option in self.OPTIONS["i"]:   # insert
             self.insert(parameters)
         elif option in self.OPTIONS["u"]:
@@ -110,9 +387,40 @@ class App:
         """
         User option 'L'
         Show something from the database
+        Return: data (data['valid'] is False for a wrong command)
         """
-        data = {"data": [], "name": "", "input": "", "chosen": "", "valid": True}
-        if parameters:
+        data = {"data": [], "name": "", "input": "", "chosen": "", "valid": True, "page_size": None, "paging": None, "format": self.output_format}
+        parameters = list(parameters)
+        stats = [param for param in parameters if param.lower() in self.PARAMETERS["l"]["stats"]]
+        for param in stats:
+            parameters.remove(param)
+        output_format = self.pop_parameter(parameters, self.PARAMETERS["l"]["format"])
+        if output_format is not None:
+            if output_format.lower() not in OUTPUT_FORMATS:
+                data["valid"] = False
+                data["name"] = "format"
+                data["input"] = output_format
+                self.print_show(data)
+                return data
+            data["format"] = output_format.lower()
+        page_size = self.pop_parameter(parameters, self.PARAMETERS["l"]["page_size"])
+        if page_size is not None:
+            if not page_size:
+                data["name"] = "no parameter page_size"
+                data["valid"] = False
+                self.print_show(data)
+                return data
+            if not (page_size.isdecimal() and int(page_size) > 0):
+                data["valid"] = False
+                data["name"] = "not number"
+                data["input"] = page_size
+                self.print_show(data)
+                return data
+            data["page_size"] = int(page_size)
+
+        if stats:
+            self.mode_stats(data)
+        elif parameters:
             mode = None
             for param in parameters:
                 if param[0] == "-":
@@ -139,14 +447,22 @@ class App:
                         self.mode_date(data, param)
                         break
 
+                    elif mode == "birthday":
+                        self.mode_birthday(data, param)
+                        break
+
                     else:
                         self.mode_name(data, param)
             else:
                 if not data["input"]:
                     data["name"] = f"no parameter {mode}"
+                    data["valid"] = False
         else:
             self.mode_table(data, "contact")
         self.print_show(data)
+        if data["paging"] and data["data"] and self.interactive:
+            self.browse_pages(data)
+        return data
 
 
     #########################
@@ -163,6 +479,51 @@ class App:
         return False
 
 
+    def pop_parameter(self, parameters, names):
+        """
+        Remove parameter with given names and its value from parameters
+        Return: value ('' if the value is missing) or None if there is no such parameter
+        """
+        for i, param in enumerate(parameters):
+            if param.lower() in names:
+                value = parameters[i + 1] if i + 1 < len(parameters) else ""
+                del parameters[i:i + 2]
+                return value
+        return None
+
+
+    def select_listing(self, data, table, parameters=None):
+        """
+        Select listing rows → the first page only if the user wants pages
+        """
+        if data["page_size"]:
+            data["paging"] = {"table": table, "parameters": parameters}
+            data["data"] = self._db.page(table, parameters, size=data["page_size"])
+        else:
+            data["data"] = self._db.listing(table, parameters)
+
+
+    def browse_pages(self, data):
+        """
+        Let the user move to the next or previous page of the listing
+        """
+        table = data["paging"]["table"]
+        parameters = data["paging"]["parameters"]
+        while True:
+            answer = input(self.messages["page"]).strip().lower()
+            if answer in ("", "n", "next"):
+                rows = self._db.page(table, parameters, after=data["data"][-1][0], size=data["page_size"])
+            elif answer in ("p", "prev", "previous"):
+                rows = self._db.page(table, parameters, before=data["data"][0][0], size=data["page_size"])
+            else:
+                return
+            if not rows:
+                print(self.messages["no page"])
+                continue
+            data["data"] = rows
+            self.print_show(data)
+
+
     def get_parameter_mode(self, data, param):
         """
         Return mode for the next parameter
@@ -176,6 +537,8 @@ class App:
             mode = "number"
         elif param in self.PARAMETERS["l"]["date"]:
             mode = "date"
+        elif param in self.PARAMETERS["l"]["birthday"]:
+            mode = "birthday"
         else:
             mode = None
             data["valid"] = False
@@ -202,10 +565,9 @@ class App:
         """
         Select contacts with first name or last name equal or similar with given parameter
         """
-        rows, _, similar = self._db.select("contact", {"first_name": param, "last_name": param}, operant="OR")
-        for row in rows:
-            if row not in data["data"]:
-                data["data"].append(row)
+        rows, similar = self._db.search_name(param)
+        shown = {row[0] for row in data["data"]}
+        data["data"].extend(row for row in rows if row[0] not in shown)
 
         if (data["name"] != "name similar contact") and not similar:
             data["name"] = "name same contact"
@@ -227,77 +589,74 @@ class App:
             data["name"] = "table"
             return
         data["chosen"] = table
-        data["data"], _, _ = self._db.select(table, {})
+        self.select_listing(data, table)
         data["name"] = f"all {table}"
 
-        if table == "contact":
-            self.change_to_group(data)
-        elif table == "phone_number":
-            self.add_plus_sign(data)
-            self.change_to_contact_name(data)
-        elif table == "prefix":
-            self.add_plus_sign(data)
-
 
     def mode_group(self, data, group_name):
         """
         Select contacts that belong to the group with given group name
         """
-        groups, _, similar_groups = self._db.select("contact_group", {"name": group_name})
-        if not groups:
-            data["valid"] = False
-            data["name"] = "no group"
-            return
-        if similar_groups:
+        group_id = self._db.group_id(group_name)
+        if group_id is None:
+            groups, _, _ = self._db.select("contact_group", {"name": group_name}, similar=True)
             data["valid"] = False
+            if not groups:
+                data["name"] = "no group"
+                return
             data["data"] = groups
             data["name"] =  "similar group"
             return
-        data["chosen"] = groups[0][1]
-        data["data"], _, _ = self._db.select("contact", {"group_id": int(groups[0][0])})
+        data["chosen"] = group_name
+        self.select_listing(data, "contact", {"group_id": group_id})
         data["name"] = "group contact"
-        self.change_to_group(data)
 
     def mode_number(self, data, param):
         """
         Select contacts with same or similar phone numbers
+        123 → contains, 123* → starts with, *123 → ends with
         """
-        if not (param.isnumeric() and int(param) > 0):
-            if (param[0] != "+") or (not param[1:].isnumeric()):
+        digits = param.strip("*")
+        if not (digits.isdecimal() and param[0] != "+"):
+            if (param[0] != "+") or (not param[1:].isdecimal()):
                 data["valid"] = False
                 data["name"] = "not number"
                 return True
 
         if param[0] == "+":
-            prefixes, _, similar = self._db.select("prefix", {"prefix": param[1:]})
+            prefix_id = self._db.prefix_id(int(param[1:]))
             data["input"] = param
-            if similar:
+            if prefix_id is None:
+                prefixes, _, _ = self._db.select("prefix", {"prefix": param[1:]}, similar=True)
                 data["valid"] = False
                 data["data"] = prefixes
                 data["name"] = "similar prefix"
                 return True
 
-            data["data"], _, _ = self._db.select("phone_number", {"prefix_id": prefixes[0][0]})
+            data["chosen"] = prefix_id
+            data["data"] = self._db.listing("phone_number", {"prefix_id": prefix_id})
             data["name"] = "prefix contact"
             return False
 
-        if data["input"]:
-            data["input"] += f"{param} "
-            numbers, _, _ = self._db.select("phone_number", {"number": int(param), "prefix_id": data["input"][1:]}, similar=True)
+        if param.endswith("*") and not param.startswith("*"):
+            mode = "starts"
+        elif param.startswith("*") and not param.endswith("*"):
+            mode = "ends"
         else:
-            numbers, _, _ = self._db.select("phone_number", {"number": int(param)}, similar=True)
+            mode = "contains"
+
+        if data["chosen"]:
+            data["input"] += f" {param}"
+            data["data"] = self._db.search_number(digits, mode, prefix_id=data["chosen"])
+        else:
+            data["data"] = self._db.search_number(digits, mode)
             data["input"] = param
-        if not numbers:
+        if not data["data"]:
             data["valid"] = False
             data["name"] = "no number"
             return True
 
         data["name"] = "number contact"
-        data["data"] = []
-        for number in numbers:
-            if number[3]:
-                rows, _, _ = self._db.select("contact", {"id": number[3]})
-                data["data"].extend(rows)
         return True
 
 
@@ -315,55 +674,33 @@ class App:
             data["valid"] = False
             data["name"] = "no-input date"
             return
-        elif not all(map(lambda x: x.isnumeric(), filter(None, date))):
+        elif not all(map(lambda x: x.isdecimal(), filter(None, date))):
             data["valid"] = False
             data["name"] = "non-numerical date"
             return
-        data["data"], _, _ = self._db.select("contact", {"date_of_birth": date})
+        self.select_listing(data, "contact", {"date_of_birth": date})
         data["name"] = "date contact"
-        self.change_to_group(data)
-
 
-    ##########################
-    #  show → modes → table  #
-    ##########################
 
-    def change_to_group(self, data):
+    def mode_stats(self, data):
         """
-        Change group id to group name
+        Statistics of executed statements (the most expensive first)
         """
-        for i, row in enumerate(data["data"].copy()):
-            if row[4]:
-                groups, _, _ = self._db.select("contact_group", {"id": row[4]})
-                data["data"][i] = list(row)
-                data["data"][i][4] = groups[0][1]
-                data["data"][i] = tuple(data["data"][i])
+        data["data"] = self._db.statement_stats()
+        data["name"] = "stats"
 
 
-    def change_to_contact_name(self, data):
+    def mode_birthday(self, data, param):
         """
-        Change contact id to contact first name and last name
+        Select contacts with birthday in the next given number of days
         """
-        for i, row in enumerate(data["data"].copy()):
-            if row[3]:
-                contacts, _, _ = self._db.select("contact", {"id": row[3]})
-                first_name = contacts[0][1] if contacts[0][1] else ""
-                last_name = contacts[0][2] if contacts[0][2] else ""
-                space = " " if first_name and last_name else ""
-                data["data"][i] = list(row)
-                data["data"][i][3] = f"{first_name}{space}{last_name}"
-                data["data"][i] = tuple(data["data"][i])
-
-
-    def add_plus_sign(self, data):
-        """
-        Add '+' in front of prefix
-        """
-        for i, row in enumerate(data["data"].copy()):
-            if row[1]:
-                data["data"][i] = list(row)
-                data["data"][i][1] = f"+{row[1]}"
-                data["data"][i] = tuple(data["data"][i])
+        data["input"] = param
+        if not param.isdecimal():
+            data["valid"] = False
+            data["name"] = "not number"
+            return
+        data["data"] = self._db.upcoming_birthdays(int(param))
+        data["name"] = "birthday contact"
 
 
     ##################
@@ -399,7 +736,7 @@ class App:
 
         elif name == "not number":
             parameter = data["input"]
-            print(self.TO_PRINT["print"]["not number"][self._language].replace("*?*", f"'{parameter}'"))
+            print(self.messages["not number"].replace("*?*", f"'{parameter}'"))
 
         elif name == "prefix contact":
             self.print_table(data, name="all phone_number", subdata=True)
@@ -408,79 +745,57 @@ class App:
             self.print_table(data, name="all prefix", subdata=True)
 
         elif name == "split date":
-            print(self.TO_PRINT["print"]["split date"][self._language])
+            print(self.messages["split date"])
 
         elif name == "non-numerical date":
-            print(self.TO_PRINT["print"]["non-numerical date"][self._language])
+            print(self.messages["non-numerical date"])
 
         elif name == "date contact":
             self.print_table(data, name="all contact")
 
+        elif name == "birthday contact":
+            self.print_table(data, name="all contact")
+
+        elif name == "stats":
+            if self._db.query_stats is None:
+                print(self.messages["no stats"])
+            else:
+                self.print_table(data, name="all stats")
+                if data["format"] == "table":
+                    print(self.messages["stats"].format(**self._db.query_stats.summary()))
+
         elif "no parameter" in name:
             mode = name[13:]
-            print(self.TO_PRINT["print"]["no parameter"][self._language].replace("*?*", f"'{mode}'"))
+            print(self.messages["no parameter"].replace("*?*", f"'{mode}'"))
 
         elif not data["valid"]:
             if name == "parameter":
                 parameter = data["input"][1:]
-                print(self.TO_PRINT["print"]["parameter"][self._language].replace("*?*", f"'{parameter}'"))
+                print(self.messages["parameter"].replace("*?*", f"'{parameter}'"))
 
             elif name == "table":
                 table = data["input"]
-                print(self.TO_PRINT["print"]["table"][self._language].replace("*?*", f"'{table}'"))
+                print(self.messages["table"].replace("*?*", f"'{table}'"))
+
+            elif name == "format":
+                output_format = data["input"]
+                print(self.messages["format"].replace("*?*", f"'{output_format}'"))
         print()
 
 
     def print_table(self, data, name=None, subdata=False):
         """
-        Print table in the terminal
+        Print table in the terminal (or as tsv / json)
         """
-        space = " "
-        dash = "-"
         name = name if name else data["name"]
-
-        all_constants = self.TO_PRINT["print"][name]
-        spaces = all_constants["spaces"]
-
-        columns_length = {"header": [], "values": []}
-        for column_name in all_constants["columns"][self._language]:
-            str_col_name = f" {column_name} "
-            columns_length["header"].append(
-                {
-                    "text": str_col_name,
-                    "length": len(str_col_name)
-                }
-            )
-
-        for i, row in enumerate(data["data"]):
-            t = 1
-            columns_length["values"].append([])
-            for j, column in enumerate(row):
-                if column == None:
-                    column = ""
-                str_col = f" {column} "
-                columns_length["values"][i].append(str_col)
-                t += len(str_col) + 1
-                columns_length["header"][j]["length"] = max(columns_length["header"][j]["length"], len(str_col))
-
-        total_length = 1
-        for column in columns_length["header"]:
-            total_length += column["length"] + 1
-
-        print(f"\n{spaces}|", end="")
-        for i, column in enumerate(columns_length["header"]):
-            column_name = column["text"]
-            current_spaces = space * (columns_length["header"][i]["length"] - len(column_name))
-            print(f"{current_spaces}{column_name}|", end="")
-        
-        print(f"\n{spaces}{dash*total_length}")
-
-        for i, row in enumerate(columns_length["values"]):
-            print(f"{spaces}|", end="")
-            for j, column_value in enumerate(row):
-                current_spaces = space * (columns_length["header"][j]["length"] - len(column_value))
-                print(f"{current_spaces}{column_value}|", end="")
-            print()
+        table = self.messages[name]
+        renderer = RENDERERS[data.get("format", self.output_format)](
+            table["columns"],
+            ContactDatabase.LISTING_COLUMNS.get(name[4:], table.get("keys")),
+            table["spaces"],
+            table["widths"]
+        )
+        renderer.write(data["data"])
 
 
     ############
@@ -512,14 +827,8 @@ class App:
             date_of_birth = self.ask_question("Date of birth: ", date=True)
             group_id = self.ask_question("Group ID: ", number=True)
             if group_id:
-                groups = self._db.select("contact_group", {})[0]
-                if groups: 
-                    contact_group_ids = [x[0] for x in groups]
-                    if group_id in contact_group_ids:
-                        everything["group_id"] = group_id
-                    else:
-                        print("  Skupina neexistuje!\n")
-                        group_id = self.ask_question("Group ID: ", number=True)
+                if self._db.exists("contact_group", group_id):
+                    everything["group_id"] = group_id
                 else:
                     print("  Skupina neexistuje!\n")
                     group_id = self.ask_question("Group ID: ", number=True)
@@ -549,13 +858,8 @@ class App:
             if number:
                 everything["number"] = number
             if contact_id:
-                contacts = self._db.select("contact", {})[0]
-                if contacts: 
-                    contact_ids = [x[0] for x in contacts]
-                    if contact_id in contact_ids:
-                        everything["contact_id"] = contact_id
-                    else:
-                        print("  Kontakt neexistuje!\n")
+                if self._db.exists("contact", contact_id):
+                    everything["contact_id"] = contact_id
                 else:
                     print("  Kontakt neexistuje!\n")
             self._db.insert(table, everything)
@@ -602,75 +906,51 @@ class App:
             if parameters[0] in self.PARAMETERS["i"]["phone_number"]:
                 data["table"] = "phone_number"
                 id_to_update = self.ask_question("Upravit číslo pro [ID]: ", mandatory=True, number=True)
-                numbers = self._db.select("phone_number", {})[0]
-                if numbers: 
-                    number_ids = [x[0] for x in numbers]
-                    if id_to_update in number_ids:
-                        number = self.ask_question("Number: ", number=True, mandatory=True)
-                        prefix_id = self.ask_question("Kód země: ", number=True)
-                        contact_id = self.ask_question("Contact ID: ", number=True)
-                        everything = {"prefix_id": prefix_id}
-                        if number:
-                            everything["number"] = number
-                        if contact_id:
-                            contacts = self._db.select("contact", {})[0]
-                            if contacts: 
-                                contact_ids = [x[0] for x in contacts]
-                                if contact_id in contact_ids:
-                                    everything["contact_id"] = contact_id
-                                else:
-                                    print("  Kontakt neexistuje!\n")
-                                    return
-                            else:
-                                print("  Kontakt neexistuje!\n")
-                                return
-                    else:
-                        print("  Číslo neexistuje!\n")
-                        return
+                if self._db.exists("phone_number", id_to_update):
+                    number = self.ask_question("Number: ", number=True, mandatory=True)
+                    prefix_id = self.ask_question("Kód země: ", number=True)
+                    contact_id = self.ask_question("Contact ID: ", number=True)
+                    everything = {"prefix_id": prefix_id}
+                    if number:
+                        everything["number"] = number
+                    if contact_id:
+                        if self._db.exists("contact", contact_id):
+                            everything["contact_id"] = contact_id
+                        else:
+                            print("  Kontakt neexistuje!\n")
+                            return
                 else:
                     print("  Číslo neexistuje!\n")
                     return
         else:
             id_to_update = self.ask_question("Upravit kontakt pro [ID]: ", mandatory=True, number=True)
-            contacts = self._db.select("contact", {})[0]
-            if contacts:
-                contact_ids = [x[0] for x in contacts]
-                if id_to_update in contact_ids:
-                    everything = {}
-                    first_name = self.ask_question("First name: ")
-                    last_name = self.ask_question("Last name: ")
-                    date_of_birth = self.ask_question("Date of birth: ", date=True)
-                    group_id = self.ask_question("Group ID: ", number=True)
-                    if group_id:
-                        groups = self._db.select("contact_group", {})[0]
-                        if groups: 
-                            contact_group_ids = [x[0] for x in groups]
-                            if group_id in contact_group_ids:
-                                everything["group_id"] = group_id
-                            else:
-                                print("  Skupina neexistuje!\n")
-                                group_id = self.ask_question("Group ID: ", number=True)
-                        else:
-                            print("  Skupina neexistuje!\n")
-                            group_id = self.ask_question("Group ID: ", number=True)
-                    street = self.ask_question("Street: ")
-                    nod = self.ask_question("Number of descriptive: ", number=True)
-                    city = self.ask_question("City: ")
-                    if first_name:
-                        everything["first_name"] = first_name
-                    if last_name:
-                        everything["last_name"] = last_name
-                    if date_of_birth:
-                        everything["date_of_birth"] = date_of_birth
-                    if street:
-                        everything["street"] = street
-                    if nod:
-                        everything["number_of_descriptive"] = nod
-                    if city:
-                        everything["city"] = city
-                else:
-                    print("  Kontakt neexistuje!\n")
-                    return
+            if self._db.exists("contact", id_to_update):
+                everything = {}
+                first_name = self.ask_question("First name: ")
+                last_name = self.ask_question("Last name: ")
+                date_of_birth = self.ask_question("Date of birth: ", date=True)
+                group_id = self.ask_question("Group ID: ", number=True)
+                if group_id:
+                    if self._db.exists("contact_group", group_id):
+                        everything["group_id"] = group_id
+                    else:
+                        print("  Skupina neexistuje!\n")
+                        group_id = self.ask_question("Group ID: ", number=True)
+                street = self.ask_question("Street: ")
+                nod = self.ask_question("Number of descriptive: ", number=True)
+                city = self.ask_question("City: ")
+                if first_name:
+                    everything["first_name"] = first_name
+                if last_name:
+                    everything["last_name"] = last_name
+                if date_of_birth:
+                    everything["date_of_birth"] = date_of_birth
+                if street:
+                    everything["street"] = street
+                if nod:
+                    everything["number_of_descriptive"] = nod
+                if city:
+                    everything["city"] = city
             else:
                 print("  Kontakt neexistuje!\n")
                 return
@@ -697,24 +977,14 @@ class App:
         table = data["table"]
         if table == "contact":
             id_to_delete = self.ask_question("Contact ID: ", mandatory=True, number=True)
-            contacts = self._db.select("contact", {})[0]
-            if contacts: 
-                contact_ids = [x[0] for x in contacts]
-                if id_to_delete in contact_ids:
-                    self._db.delete("contact", id_to_delete)
-                else:
-                    print("  Kontakt neexistuje!\n")
+            if self._db.exists("contact", id_to_delete):
+                self._db.delete("contact", id_to_delete)
             else:
                 print("  Kontakt neexistuje!\n")
         elif table == "phone_number":
             id_to_delete = self.ask_question("Phone number ID: ", mandatory=True, number=True)
-            phone_numbers = self._db.select("phone_number", {})[0]
-            if phone_numbers: 
-                phone_number_ids = [x[0] for x in phone_numbers]
-                if id_to_delete in phone_number_ids:
-                    self._db.delete("phone_number", id_to_delete)
-                else:
-                    print("  Číslo neexistuje!\n")
+            if self._db.exists("phone_number", id_to_delete):
+                self._db.delete("phone_number", id_to_delete)
             else:
                 print("  Číslo neexistuje!\n")
 
@@ -723,94 +993,11 @@ class App:
     ###########
 
     def wrong_command(self, option):
-        print(self.TO_PRINT["print"]["wrong"][self._language].replace("*?*", f"'{option}'"))
+        print(self.messages["wrong"].replace("*?*", f"'{option}'"))
 
 
     def print_options(self):
-        print(self.TO_PRINT["print"]["options"][self._language])
-
-
-    #######################
-    #  print → constants  #
-    #######################
-
-    def load_print_constants(self):
-
-        dash = "-"
-        space = " "
-        comma = "."
-
-        dash_options = dash * 80
-        spaces_options = space * 6
-
-        self.TO_PRINT = {
-            "input": {
-                "en": f"{space*4}Choose one option: ",
-                "cz": f"{space*4}Vyber jednu z možností: ",
-            },
-            "print": {
-                "options": {
-                    "en": f"{dash_options}\nH {comma*20} show this table\nL {comma*20} list all contacts\nL (contact name) ... show contact with given name or similar ones\nL -n (number) ... show contacts with given number or similar\nL -g (group) ... show contacts within group\nL -t (table) ... show all rows in a table\nL -d (date) ... show contacts that date of birth matches with given date → format: YYYY-MM-DD\n{space*78}day: --DD\n{space*76}month: -MM-\n{space*77}year: YYYY--\nI ... insert row into contact table\nI -t (table) ... insert row into table\nD ... delete row from contact table\nD -t (table) ... delete row from table\nQ ... quit the application\n{dash*20}",
-                    "cz": f"{spaces_options}{dash_options}\n{spaces_options}| H {comma*16} ukáže tuto tabulku{space*40}|\n{spaces_options}| L (jméno) {comma*8} ukáže kontakt podle jména nebo podobné kontakty{space*11}|\n{spaces_options}| L -n (číslo) {comma*5} ukáže kontakty podle čísla nebo podobné kontakty{space*10}|\n{spaces_options}| L -g (skupina) {comma*3} ukáže kontakty ve skupině{space*33}|\n{spaces_options}| L -t (tabulka) {comma*3} ukáže všechny řádky v tabulce{space*29}|\n{spaces_options}| L -d (datum) {comma*5} ukáže kontakty podle data narození → formát: YYYY/MM/DD{space*3}|\n{spaces_options}|{space*60}den: //DD{space*9}|\n{spaces_options}|{space*58}měsíc: /MM/{space*9}|\n{spaces_options}|{space*60}rok: YYYY//{space*7}|\n{spaces_options}| I {comma*16} vloží kontakt do tabulky{space*34}|\n{spaces_options}| I (tabulka) {comma*6} vloží řádek do tabulky{space*36}|\n{spaces_options}| D {comma*16} odstraní kontakt{space*42}|\n{spaces_options}| D (tabulka) {comma*6} odstraní řádek z tabulky{space*34}|\n{spaces_options}| U {comma*16} uprav kontakt{space*45}|\n{spaces_options}| U (tabulka) {comma*6} uprav řádek z tabulky{space*37}|\n{spaces_options}| Q {comma*16} ukončí aplikaci{space*43}|\n{spaces_options}{dash_options}",
-                },
-                "wrong": {
-                    "en": f"{space*6}Bash *?* does not exists!\n",
-                    "cz": f"{space*6}Příkaz *?* neexistuje!\n",
-                },
-                "all contact": {
-                    "spaces": f"{space*6}",
-                    "columns": {
-                        "en": ["ID", "First name", "Last name", "Date of birth", "Group", "Street", "Number of descriptive", "City"],
-                        "cz": ["ID", "Jméno", "Příjmení", "Datum narození", "Skupina", "Ulice", "Číslo popisné", "Město"],
-                    }
-                },
-                "all contact_group": {
-                    "spaces": f"{space*6}",
-                    "columns": {
-                        "en": ["ID", "Group"],
-                        "cz": ["ID", "Skupina"]
-                    }
-                },
-                "all prefix": {
-                    "spaces": f"{space*6}",
-                    "columns": {
-                        "en": ["ID", "Prefix", "State"],
-                        "cz": ["ID", "Předčíslí", "Stát"]
-                    }
-                },
-                "all phone_number": {
-                    "spaces": f"{space*6}",
-                    "columns": {
-                        "en": ["ID", "Prefix", "Number", "Contact"],
-                        "cz": ["ID", "Předčíslí", "Číslo", "Kontakt"]
-                    }
-                },
-                "no parameter": {
-                    "en": "no parameter",
-                    "cz": f"{space*6}Pro *?* chybí parameter!"
-                },
-                "parameter": {
-                    "en": "wrong parameter",
-                    "cz": f"{space*6}Parameter *?* neexistuje!"
-                },
-                "table": {
-                    "en": "wrong table",
-                    "cz": f"{space*6}Tabulka *?* neexistuje!\n{space*6}Zkus 'contact', 'group', 'number', 'prefix'."
-                },
-                "not number": {
-                    "en": "not number",
-                    "cz": f"{space*6}Parameter *?* není číslo!"
-                },
-                "split date": {
-                    "en": f"{space*6}Not a right format for a date!",
-                    "cz": f"{space*6}Datum je zadané ve špatném formátu!"
-                },
-                "non-numerical date": {
-                    "en": f"{space*6}Not a right format for a date!",
-                    "cz": f"{space*6}Datum musí být zadané v číselném formátu!"
-                },
-            }
-        }
+        print(self.messages["options"])
 
 
     #############
@@ -821,185 +1008,3041 @@ class App:
         self._db.close()
 
 
-#####################
-#  ContactDatabase  #
-#####################
+##############
+#  Profiler  #
+##############
+
+class Profiler:
+    """
+    Opt-in profiling of App commands → inclusive time of every stage of each command
+    with database time (from QueryStats) and render time (print_table) separated,
+    the whole run can be dumped as pstats file or as collapsed stacks for flamegraphs
+    """
+    STAGES = (
+        "parse_command", "show", "mode_name", "mode_table", "mode_group", "mode_number", "mode_date",
+        "mode_birthday", "mode_stats", "print_show", "print_table", "insert", "update", "delete",
+    )
+    RENDER = "print_table"
+
+    def __init__(self, dump=None, file=None):
+        self.dump = dump
+        self.file = file or sys.stderr
+        self.app = None
+        self.stages = None
+        self.parsing = 0.0
+        self.totals = collections.defaultdict(lambda: [0, 0.0])
+        self.profile = None
+
+
+    def attach(self, app):
+        """
+        Wrap the stages of the app (only this instance, App itself stays untouched)
+        """
+        self.app = app
+        for name in self.STAGES:
+            setattr(app, name, self.timed(name, getattr(app, name)))
+        manage_option = app.manage_option
+
+        @functools.wraps(manage_option)
+        def command(option, parameters):
+            return self.command(manage_option, option, parameters)
+        app.manage_option = command
+
+
+    def timed(self, name, method):
+        @functools.wraps(method)
+        def stage(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return stage
+
+
+    def add(self, name, elapsed):
+        if name == "parse_command":
+            self.parsing += elapsed
+        elif self.stages is not None:
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+
+    def command(self, manage_option, option, parameters):
+        """
+        Run one command and report its stages
+        """
+        self.stages = {"parse_command": self.parsing}
+        self.parsing = 0.0
+        db_before = self.db_ms()
+        start = time.perf_counter()
+        try:
+            return manage_option(option, parameters)
+        finally:
+            total = time.perf_counter() - start + self.stages["parse_command"]
+            stages, self.stages = self.stages, None
+            self.report(" ".join([option, *parameters]), total, (self.db_ms() - db_before) / 1000, stages)
+
+
+    def db_ms(self):
+        query_stats = self.app._db.query_stats
+        return query_stats.summary()["total_ms"] if query_stats else 0.0
+
+
+    def report(self, command, total, db, stages):
+        """
+        Print times of one command and add them to the totals
+        """
+        render = stages.get(self.RENDER, 0.0)
+        times = {"total": total, "db": db, "render": render, "other": max(total - db - render, 0.0), **stages}
+        for name, elapsed in times.items():
+            self.totals[name][0] += 1
+            self.totals[name][1] += elapsed
+        print(f"profile: {command} | " + " | ".join(f"{name} {elapsed * 1000:.3f} ms" for name, elapsed in times.items()), file=self.file)
+
+
+    def start(self):
+        """
+        Start profiling of the whole run (only with dump file)
+        """
+        if not self.dump:
+            return
+        self.profile = StackProfiler() if Path(self.dump).suffix.lower() in PROFILE_COLLAPSED else cProfile.Profile()
+        self.profile.enable()
+
+
+    def stop(self):
+        """
+        Stop profiling, write the dump file and print totals of all commands
+        """
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.dump)
+            self.profile = None
+        if not self.totals:
+            return
+        print(f"profile: {'stage': <16}{'count': >8}{'total ms': >14}{'mean ms': >12}", file=self.file)
+        for name, (count, elapsed) in self.totals.items():
+            print(f"profile: {name: <16}{count: >8}{elapsed * 1000: >14.3f}{elapsed * 1000 / count: >12.3f}", file=self.file)
 
-class ContactDatabase:
-    TABLES = {
-        "contact": "id, first_name, last_name, date_of_birth, group_id, street, number_of_descriptive, city",
-        "contact_group": "id, name",
-        "prefix": "id, prefix, state",
-        "phone_number": "id, prefix_id, number, contact_id"
-    }
 
+class StackProfiler:
+    """
+    Deterministic profiler measuring self time of every call stack (calls of C functions included),
+    dump_stats writes collapsed stacks ('a;b;c microseconds' per line) for flamegraph.pl or speedscope
+    """
     def __init__(self):
-        self.db_path = Path(f"{Path(__file__).parent.resolve()}/{DB_PATH}{DB_NAME}")
-        self.connection = sqlite3.connect(self.db_path)
-        self.cursor = self.connection.cursor()
-        self.create_database()
+        # node → [self time, children by label, parent]
+        self.root = [0.0, {}, None]
+        self.node = self.root
+        self.last = 0.0
 
 
-    def select(self, table, parameters: dict, operant="AND", similar=False):
-        if table in self.TABLES:
-            columns = self.TABLES[table]
-        else:
-            return "table", False, similar
+    def enable(self):
+        self.node = self.root
+        self.last = time.perf_counter()
+        sys.setprofile(self.event)
 
-        where_param = ""
-        if parameters:
-            add_param = []
-            values = []
-            for column, value in parameters.items():
-                if column not in self.TABLES[table].split(", "):
-                    return "column", False, similar
-                if column == "date_of_birth":
-                    add_param.append(r"strftime('%Y', date_of_birth) = ? OR strftime('%m', date_of_birth) = ? OR strftime('%d', date_of_birth) = ?")
-                    year = value[0]
-                    month = value[1]
-                    day = value[2]
-                    if year:
-                        values.append(f"{int(year):04d}")
-                    else:
-                        values.append(year)
-                    if month:
-                        values.append(f"{int(month):02d}")
-                    else:
-                        values.append(month)
-                    if day:
-                        values.append(f"{int(day):02d}")
-                    else:
-                        values.append(day)
-                    continue
-                if similar:
-                    add_param.append(f"{column} LIKE ?")
-                else:
-                    add_param.append(f"{column} = ?")
-                values.append(value)
-            where_param += " WHERE " + f" {operant} ".join(add_param)
 
-        if parameters:
-            if similar:
-                self.cursor.execute(f"SELECT {columns} FROM {table}{where_param};", tuple(map(lambda v: f"%{v}%", values)))
-            else:
-                self.cursor.execute(f"SELECT {columns} FROM {table}{where_param};", tuple(values))
-        else:
-            self.cursor.execute(f"SELECT {columns} FROM {table};")
+    def disable(self):
+        sys.setprofile(None)
 
-        data = self.cursor.fetchall()
-        if data or similar: return data, True, similar
-        return self.select(table, parameters, operant, similar=True)
 
+    def event(self, frame, event, arg):
+        now = time.perf_counter()
+        self.node[0] += now - self.last
+        if event == "call":
+            self.enter(f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_qualname}")
+        elif event == "c_call":
+            self.enter(f"{getattr(arg, '__module__', None) or 'builtins'}:{getattr(arg, '__qualname__', arg.__name__)}")
+        elif self.node is not self.root:   # return, c_return, c_exception
+            self.node = self.node[2]
+        self.last = time.perf_counter()
 
-    def insert(self, table, parameters: dict):
-        columns = ", ".join(parameters.keys())
-        values = ""
-        for value in parameters.values():
-            if type(value) is int:
-                values += f"{value}, "
-            else:
-                values += f"'{value}', "
-        values = values[:-2]
-        self.cursor.execute(f"INSERT INTO {table} ({columns}) VALUES ({values});")
-        self.connection.commit()
 
+    def enter(self, label):
+        child = self.node[1].get(label)
+        if child is None:
+            child = self.node[1][label] = [0.0, {}, self.node]
+        self.node = child
 
-    def update(self, table, parameters: dict, id_to_update):
-        to_update = ""
-        for column, value in parameters.items():
-            if type(value) is int:
-                to_update += f"{column} = {value}, "
-            else:
-                to_update += f"{column} = '{value}', "
-        to_update = to_update[:-2]
-        self.cursor.execute(f"UPDATE {table} SET {to_update} WHERE id = {id_to_update};")
 
+    def dump_stats(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            stack = [(label, child, [label]) for label, child in self.root[1].items()]
+            while stack:
+                label, node, names = stack.pop()
+                if int(node[0] * 1e6):
+                    file.write(f"{';'.join(names)} {int(node[0] * 1e6)}\n")
+                stack.extend((child_label, child, names + [child_label]) for child_label, child in node[1].items())
 
-    def delete(self, table, id_to_delete):
-        self.cursor.execute(f"DELETE FROM {table} WHERE id = {id_to_delete}")
-        self.connection.commit()
 
+##############
+#  LRUCache  #
+##############
+
+class LRUCache:
+    """
+    Thread-safe dict with limited size → the least recently used key is dropped first
+    """
+    def __init__(self, size):
+        self.size = size
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def create_database(self):
+
+    def get(self, key, load, cacheable=None):
         """
-        Create database tables if not already exists
+        Return: cached value, on miss the value is loaded by load(key)
+        and cached (if cacheable(value) is true when given)
         """
-        tables = [
-            """CREATE TABLE IF NOT EXISTS 'contact_group' (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name VARCHAR(255) NOT NULL UNIQUE)
-                ;
-            """,
-            """CREATE TABLE IF NOT EXISTS 'contact' (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                first_name VARCHAR(60),
-                last_name VARCHAR(60),
-                date_of_birth DATE,
-                group_id INTEGER,
-                street VARCHAR(60),
-                number_of_descriptive INTEGER,
-                city VARCHAR(60),
-                FOREIGN KEY (group_id)
-                    REFERENCES contact_group(id)
-                );
-            """,
-            """CREATE TABLE IF NOT EXISTS 'prefix' (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                prefix INTEGER NOT NULL UNIQUE,
-                state VARCHAR(255) NOT NULL UNIQUE
-                );
-            """,
-            """CREATE TABLE IF NOT EXISTS 'phone_number' (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                prefix_id INTEGER NOT NULL DEFAULT 420,
-                number INTEGER NOT NULL,
-                contact_id INTEGER,
-                FOREIGN KEY (prefix_id)
-                    REFERENCES prefix(id),
-                FOREIGN KEY (contact_id)
-                    REFERENCES contact(id)
-                );
-            """,
-        ]
-        self.cursor.execute("PRAGMA foreign_keys = ON;")
-        self.cursor.execute("PRAGMA case_sensitive_like = false;")
-        for table in tables:
-            self.cursor.execute(table)
-        self.connection.commit()
-        self.cursor.execute("PRAGMA foreign_keys = OFF;")
-        self.connection.commit()
-
-        inserts = [
-            """INSERT INTO contact_group
-                SELECT 1, 'family'
-                WHERE NOT EXISTS (SELECT 1 FROM contact_group WHERE name='family');
-            """,
-            """INSERT INTO contact_group
-                SELECT 2, 'friends'
-                WHERE NOT EXISTS (SELECT 1 FROM contact_group WHERE name='family');
-            """,
-            """INSERT INTO contact_group
-                SELECT 3, 'work'
-                WHERE NOT EXISTS (SELECT 1 FROM contact_group WHERE name='family');
-            """,
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+        value = load(key)
+        if cacheable is None or cacheable(value):
+            self.put(key, value)
+        return value
+
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.data)}
+
+
+################
+#  QueryStats  #
+################
+
+class QueryStats:
+    """
+    Statistics of executed statements grouped by their shape (sql with normalized whitespace and lists of '?'),
+    statements slower than slow_ms are logged together with their query plan
+    """
+    BUCKETS = (0.1, 1, 10, 100, 1000)   # ms → upper bounds of histogram buckets, the last bucket is for slower ones
+    SLOW_QUERIES = 100                  # last slow queries kept in memory
+    EXPLAINED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+    COLUMNS = ("id", "statement", "count", "total_ms", "mean_ms", "max_ms", "rows", "slow", "histogram")
+
+    def __init__(self, slow_ms=None, slow_log=None):
+        self.slow_ms = float(slow_ms if slow_ms is not None else os.environ.get("CONTACTDB_SLOW_MS", SLOW_QUERY_MS))
+        self.slow_log = slow_log or os.environ.get("CONTACTDB_SLOW_LOG") or SLOW_QUERY_LOG
+        self.lock = threading.Lock()
+        self.shapes = {}
+        self.statements = {}
+        self.slow = collections.deque(maxlen=self.SLOW_QUERIES)
+
+
+    def shape(self, sql):
+        """
+        Return: shape of the statement → 'IN (?, ?, ?)' of any length is 'IN (?, ...)'
+        """
+        shape = self.statements.get(sql)
+        if shape is None:
+            shape = re.sub(r"\?(\s*,\s*\?)+", "?, ...", " ".join(sql.split()))
+            if len(self.statements) >= STATEMENT_SHAPES:
+                self.statements.clear()
+            self.statements[sql] = shape
+        return shape
+
+
+    @staticmethod
+    def shape_id(shape):
+        """
+        Return: short stable id of the statement shape → tells apart statements shortened to the same text in the table
+        """
+        return f"{zlib.crc32(shape.encode()):08x}"
+
+
+    def record(self, connection, sql, parameters, rows, elapsed):
+        """
+        Add one executed statement (time in seconds including fetching of its rows)
+        """
+        ms = elapsed * 1000
+        shape = self.shape(sql)
+        slow = ms >= self.slow_ms
+        with self.lock:
+            stats = self.shapes.get(shape)
+            if stats is None:
+                stats = self.shapes[shape] = {
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "slow": 0,
+                    "histogram": [0] * (len(self.BUCKETS) + 1), "parameters": None
+                }
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            stats["rows"] += rows
+            stats["slow"] += slow
+            stats["histogram"][bisect.bisect_left(self.BUCKETS, ms)] += 1
+            stats["parameters"] = parameters
+        if slow:
+            self.log_slow(connection, sql, shape, parameters, rows, ms)
+
+
+    def log_slow(self, connection, sql, shape, parameters, rows, ms):
+        """
+        Keep the slow statement with its query plan in memory and append it to the slow query log
+        """
+        entry = {
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "ms": round(ms, 3),
+            "rows": rows,
+            "id": self.shape_id(shape),
+            "statement": shape,
+            "parameters": None if parameters is None else list(parameters),
+            "plan": self.explain(connection, sql, shape, parameters),
+        }
+        with self.lock:
+            self.slow.append(entry)
+            if self.slow_log:
+                with open(self.slow_log, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
 
+    def explain(self, connection, sql, shape, parameters):
+        """
+        Return: lines of EXPLAIN QUERY PLAN (indented by depth), empty for other than DML statements
+        """
+        if shape.split(" ", 1)[0].upper() not in self.EXPLAINED or (parameters is None and "?" in sql):
+            return []
+        try:
+            # plain cursor → the plan itself is not recorded
+            plan = sqlite3.Cursor(connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+        except sqlite3.Error as error:
+            return [f"{type(error).__name__}: {error}"]
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in plan:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append(f"{'  ' * depth[node]}{detail}")
+        return lines
+
+
+    def rows(self):
+        """
+        Return: rows of COLUMNS for every statement shape, the most expensive first
+        """
+        with self.lock:
+            shapes = [(shape, dict(stats, histogram=list(stats["histogram"]))) for shape, stats in self.shapes.items()]
+        shapes.sort(key=lambda item: item[1]["total_ms"], reverse=True)
+        return [
+            (
+                self.shape_id(shape), shape, stats["count"], round(stats["total_ms"], 3), round(stats["total_ms"] / stats["count"], 3),
+                round(stats["max_ms"], 3), stats["rows"], stats["slow"], self.histogram(stats["histogram"])
+            )
+            for shape, stats in shapes
         ]
-        for ins in inserts:
-            self.cursor.execute(ins)
-        self.connection.commit()
 
 
-    def close(self):
-        self.connection.close()
+    def histogram(self, counts):
+        """
+        Return: histogram as text, ex. '<1ms:10 <10ms:2' (empty buckets are left out)
+        """
+        labels = [f"<{bound:g}ms" for bound in self.BUCKETS] + [f">{self.BUCKETS[-1]:g}ms"]
+        return " ".join(f"{label}:{count}" for label, count in zip(labels, counts) if count)
 
 
-#################
-#  main script  #
-#################
+    def summary(self):
+        """
+        Return: dict → number of statements, their total time, number of slow ones, slow threshold
+        """
+        with self.lock:
+            return {
+                "queries": sum(stats["count"] for stats in self.shapes.values()),
+                "total_ms": round(sum(stats["total_ms"] for stats in self.shapes.values()), 3),
+                "slow": sum(stats["slow"] for stats in self.shapes.values()),
+                "slow_ms": self.slow_ms,
+            }
+
+
+    def reset(self):
+        with self.lock:
+            self.shapes = {}
+            self.slow.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor reporting every statement to QueryStats of its connection,
+    time and rows of a query include fetching → the query is recorded when all its rows are fetched,
+    after fetchone or before the next statement
+    """
+    query = None
+    elapsed = 0.0
+    fetched = 0
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        self.query = (sql, parameters)
+        self.elapsed = 0.0
+        self.fetched = 0
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except BaseException:
+            self.elapsed += time.perf_counter() - start
+            self.finish()
+            raise
+        self.elapsed += time.perf_counter() - start
+        if self.description is None:    # nothing to fetch
+            self.fetched = max(self.rowcount, 0)
+            self.finish()
+        return self
+
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.query_stats.record(self.connection, sql, None, max(self.rowcount, 0), time.perf_counter() - start)
+        return self
+
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.elapsed += time.perf_counter() - start
+        self.fetched += row is not None
+        self.finish()
+        return row
+
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.elapsed += time.perf_counter() - start
+        self.fetched += len(rows)
+        if len(rows) < (self.arraysize if size is None else size):
+            self.finish()
+        return rows
+
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.elapsed += time.perf_counter() - start
+        self.fetched += len(rows)
+        self.finish()
+        return rows
+
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.finish()
+            raise
+        self.elapsed += time.perf_counter() - start
+        self.fetched += 1
+        return row
+
+
+    def finish(self):
+        """
+        Record the running query (if there is one)
+        """
+        if self.query is not None:
+            sql, parameters = self.query
+            self.query = None
+            self.connection.query_stats.record(self.connection, sql, parameters, self.fetched, self.elapsed)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection creating InstrumentedCursors (also for its execute shortcuts)
+    """
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+####################
+#  ConnectionPool  #
+####################
+
+class ThreadReader:
+    """
+    Read connection of one thread with its cursors → kept only by the thread-local storage of the pool,
+    so it is closed as soon as its thread ends
+    """
+    __slots__ = ("connection", "cursor", "version_cursor", "data_version", "__weakref__")
+
+    def __init__(self, connection, cursor, version_cursor):
+        self.connection = connection
+        self.cursor = cursor
+        self.version_cursor = version_cursor
+        self.data_version = None
+
+
+class ConnectionPool:
+    """
+    Connections to one database file → every thread reads through its own connection (closed when the thread ends),
+    writes go through one writer connection guarded by a lock
+    """
+    def __init__(self, db_path, pragmas: dict, query_stats=None):
+        self.db_path = db_path
+        self.pragmas = dict(pragmas)
+        self.query_stats = query_stats
+        self.lock = threading.RLock()           # writes
+        self.connections_lock = threading.Lock() # lists of connections and cursors → readers never wait for a write
+        self.local = threading.local()
+        self.readers = []
+        self.cursors = []
+        self.writer = self.connect(self.pragmas)
+        self.writer_cursor = self.cursor(self.writer)
+
+
+    def connect(self, pragmas: dict, read_only=False):
+        """
+        Return: new connection with given PRAGMAs
+        """
+        if self.query_stats is None:
+            connection = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(
+                self.db_path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False, factory=InstrumentedConnection
+            )
+            connection.query_stats = self.query_stats
+        for pragma, value in pragmas.items():
+            connection.execute(f"PRAGMA {pragma} = {value};").fetchall()
+        if read_only:
+            connection.execute("PRAGMA query_only = ON;")
+        return connection
+
+
+    def thread_reader(self):
+        """
+        Return: ThreadReader of the calling thread (opened on the first use, closed when the thread ends)
+        """
+        reader = getattr(self.local, "reader", None)
+        if reader is None:
+            connection = self.connect(self.reader_pragmas(), read_only=True)
+            # plain cursor → PRAGMA data_version is not counted by the query statistics
+            reader = ThreadReader(connection, self.cursor(connection), self.cursor(connection, sqlite3.Cursor))
+            with self.connections_lock:
+                self.readers.append(connection)
+            weakref.finalize(reader, self.release, connection)
+            self.local.reader = reader
+        return reader
+
+
+    def reader(self):
+        """
+        Return: read connection of the calling thread
+        """
+        return self.thread_reader().connection
+
+
+    def release(self, connection):
+        """
+        Close the read connection of an ended thread with its cursors
+        """
+        with self.connections_lock:
+            if connection not in self.readers:
+                return
+            self.readers.remove(connection)
+            cursors = [cursor for cursor in self.cursors if cursor.connection is connection]
+            self.cursors = [cursor for cursor in self.cursors if cursor.connection is not connection]
+        for cursor in cursors:
+            cursor.close()
+        connection.close()
+
+
+    def cursor(self, connection, factory=None):
+        """
+        Return: new cursor of the connection, closed together with the pool
+        """
+        cursor = connection.cursor() if factory is None else connection.cursor(factory)
+        with self.connections_lock:
+            self.cursors.append(cursor)
+        return cursor
+
+
+    def reader_cursor(self):
+        """
+        Return: cursor of the read connection of the calling thread
+        """
+        return self.thread_reader().cursor
+
+
+    def data_changed(self):
+        """
+        Check PRAGMA data_version of the read connection of the calling thread, no lock is taken
+        The value is counted per connection → the first check of a thread and every commit since its last check
+        (of any other connection, also the writer of this pool) are reported as a change
+        Return: True or False
+        """
+        reader = self.thread_reader()
+        reader.version_cursor.execute("PRAGMA data_version;")
+        data_version = reader.version_cursor.fetchone()[0]
+        changed = data_version != reader.data_version
+        reader.data_version = data_version
+        return changed
+
+
+    def reader_pragmas(self):
+        """
+        Return: PRAGMAs for read connections → journal mode is set by the writer
+        """
+        return {pragma: value for pragma, value in self.pragmas.items() if pragma != "journal_mode"}
+
+
+    def configure(self, pragmas: dict):
+        """
+        Set PRAGMAs of the writer and all read connections (also the future ones)
+        """
+        with self.lock, self.connections_lock:
+            self.pragmas.update(pragmas)
+            for pragma, value in pragmas.items():
+                self.writer.execute(f"PRAGMA {pragma} = {value};").fetchall()
+                if pragma == "journal_mode":
+                    continue
+                for reader in self.readers:
+                    reader.execute(f"PRAGMA {pragma} = {value};").fetchall()
+
+
+    def close(self):
+        """
+        Close cursors first → statements are finalized, so the last connection removes -wal and -shm files
+        """
+        with self.lock, self.connections_lock:
+            for cursor in self.cursors:
+                cursor.close()
+            self.cursors = []
+            for reader in self.readers:
+                reader.close()
+            self.readers = []
+            self.writer.close()
+
+
+#####################
+#  ContactDatabase  #
+#####################
+
+class ContactDatabase:
+    TABLES = {
+        "contact": "id, first_name, last_name, date_of_birth, group_id, street, number_of_descriptive, city",
+        "contact_group": "id, name",
+        "prefix": "id, prefix, state",
+        "phone_number": "id, prefix_id, number, contact_id"
+    }
+    COLUMNS = {table: tuple(columns.split(", ")) for table, columns in TABLES.items()}
+    # rows as they are shown to the user → names instead of ids, '+' in front of prefix
+    LISTINGS = {
+        "contact": """SELECT contact.id, contact.first_name, contact.last_name, contact.date_of_birth,
+                contact_group.name, contact.street, contact.number_of_descriptive, contact.city
+            FROM contact
+            LEFT JOIN contact_group ON contact_group.id = contact.group_id""",
+        "contact_group": "SELECT contact_group.id, contact_group.name FROM contact_group",
+        "prefix": "SELECT prefix.id, '+' || prefix.prefix, prefix.state FROM prefix",
+        "phone_number": """SELECT phone_number.id, '+' || prefix.prefix, phone_number.number,
+                TRIM(COALESCE(contact.first_name, '') || ' ' || COALESCE(contact.last_name, ''))
+            FROM phone_number
+            LEFT JOIN prefix ON prefix.id = phone_number.prefix_id
+            LEFT JOIN contact ON contact.id = phone_number.contact_id""",
+    }
+    # the same listings read from contact_view (when it is turned on) → no joins, the rows are display-ready
+    VIEW_LISTINGS = {
+        "contact": """SELECT contact.id, contact.first_name, contact.last_name, contact.date_of_birth,
+                contact.group_name, contact.street, contact.number_of_descriptive, contact.city
+            FROM contact_view AS contact""",
+        "phone_number": """SELECT phone_number.id, '+' || prefix.prefix, phone_number.number, COALESCE(contact.full_name, '')
+            FROM phone_number
+            LEFT JOIN prefix ON prefix.id = phone_number.prefix_id
+            LEFT JOIN contact_view AS contact ON contact.id = phone_number.contact_id""",
+        "contact_view": """SELECT contact_view.id, contact_view.full_name, contact_view.date_of_birth, contact_view.group_name,
+                contact_view.street, contact_view.number_of_descriptive, contact_view.city, contact_view.numbers
+            FROM contact_view""",
+    }
+    # tables whose writes change rows of LISTINGS (results of the cache depend on them)
+    DEPENDENCIES = {
+        "contact": ("contact", "contact_group"),
+        "contact_group": ("contact_group",),
+        "prefix": ("prefix",),
+        "phone_number": ("phone_number", "prefix", "contact"),
+        "contact_view": ("contact", "contact_group", "phone_number", "prefix"),
+    }
+    # column names of LISTINGS rows
+    LISTING_COLUMNS = {
+        "contact": ("id", "first_name", "last_name", "date_of_birth", "group", "street", "number_of_descriptive", "city"),
+        "contact_group": ("id", "name"),
+        "prefix": ("id", "prefix", "state"),
+        "phone_number": ("id", "prefix", "number", "contact"),
+        "contact_view": ("id", "name", "date_of_birth", "group", "street", "number_of_descriptive", "city", "numbers"),
+    }
+    # exported rows → listing rows with the ids import needs to link them again (the contact of a phone number)
+    EXPORTS = {
+        "phone_number": """SELECT phone_number.id, '+' || prefix.prefix, phone_number.number,
+                TRIM(COALESCE(contact.first_name, '') || ' ' || COALESCE(contact.last_name, '')), phone_number.contact_id
+            FROM phone_number
+            LEFT JOIN prefix ON prefix.id = phone_number.prefix_id
+            LEFT JOIN contact ON contact.id = phone_number.contact_id""",
+    }
+    EXPORT_COLUMNS = {**LISTING_COLUMNS, "phone_number": ("id", "prefix", "number", "contact", "contact_id")}
+    # secondary indexes for every lookup done by App.mode_* (name → columns)
+    # phone_number indexes are covering → listing by number, contact or prefix never touches the table
+    INDEXES = {
+        "idx_contact_first_name": "contact (first_name)",
+        "idx_contact_last_name": "contact (last_name)",
+        "idx_contact_group_id": "contact (group_id)",
+        "idx_contact_birth_year": "contact (birth_year)",
+        "idx_contact_birth_month_day": "contact (birth_month, birth_day)",
+        "idx_contact_birth_day": "contact (birth_day)",
+        "idx_phone_number_number": "phone_number (number, prefix_id, contact_id)",
+        "idx_phone_number_contact_id": "phone_number (contact_id, prefix_id, number)",
+        "idx_phone_number_prefix_id": "phone_number (prefix_id, number, contact_id)",
+    }
+    # parts of date of birth → generated columns, so dates can be searched by index
+    BIRTH_COLUMNS = {
+        "birth_year": "INTEGER GENERATED ALWAYS AS (CAST(strftime('%Y', date_of_birth) AS INTEGER)) VIRTUAL",
+        "birth_month": "INTEGER GENERATED ALWAYS AS (CAST(strftime('%m', date_of_birth) AS INTEGER)) VIRTUAL",
+        "birth_day": "INTEGER GENERATED ALWAYS AS (CAST(strftime('%d', date_of_birth) AS INTEGER)) VIRTUAL",
+    }
+    # fuzzy name search → trigram full-text index kept in sync with contact by triggers
+    NAME_SEARCH = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS contact_search USING fts5(
+            first_name, last_name, content='contact', content_rowid='id', tokenize='trigram');
+        """,
+        """CREATE TRIGGER IF NOT EXISTS contact_search_insert AFTER INSERT ON contact BEGIN
+            INSERT INTO contact_search (rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name);
+        END;
+        """,
+        """CREATE TRIGGER IF NOT EXISTS contact_search_delete AFTER DELETE ON contact BEGIN
+            INSERT INTO contact_search (contact_search, rowid, first_name, last_name) VALUES ('delete', old.id, old.first_name, old.last_name);
+        END;
+        """,
+        """CREATE TRIGGER IF NOT EXISTS contact_search_update AFTER UPDATE OF id, first_name, last_name ON contact BEGIN
+            INSERT INTO contact_search (contact_search, rowid, first_name, last_name) VALUES ('delete', old.id, old.first_name, old.last_name);
+            INSERT INTO contact_search (rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name);
+        END;
+        """,
+    ]
+    # partial number search → digits of every phone number in a trigram full-text index
+    NUMBER_SEARCH = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS number_search USING fts5(digits, tokenize='trigram');
+        """,
+        """CREATE TRIGGER IF NOT EXISTS number_search_insert AFTER INSERT ON phone_number BEGIN
+            INSERT INTO number_search (rowid, digits) VALUES (new.id, CAST(new.number AS TEXT));
+        END;
+        """,
+        """CREATE TRIGGER IF NOT EXISTS number_search_delete AFTER DELETE ON phone_number BEGIN
+            DELETE FROM number_search WHERE rowid = old.id;
+        END;
+        """,
+        """CREATE TRIGGER IF NOT EXISTS number_search_update AFTER UPDATE OF id, number ON phone_number BEGIN
+            DELETE FROM number_search WHERE rowid = old.id;
+            INSERT INTO number_search (rowid, digits) VALUES (new.id, CAST(new.number AS TEXT));
+        END;
+        """,
+    ]
+    # optional read model → one display-ready row for every contact kept current by triggers
+    CONTACT_VIEW = """CREATE TABLE IF NOT EXISTS contact_view (
+        id INTEGER PRIMARY KEY,
+        first_name VARCHAR(60),
+        last_name VARCHAR(60),
+        full_name VARCHAR(121),
+        date_of_birth DATE,
+        birth_year INTEGER,
+        birth_month INTEGER,
+        birth_day INTEGER,
+        group_id INTEGER,
+        group_name VARCHAR(255),
+        street VARCHAR(60),
+        number_of_descriptive INTEGER,
+        city VARCHAR(60),
+        numbers TEXT
+        );
+    """
+    CONTACT_VIEW_INDEXES = {
+        "idx_contact_view_first_name": "contact_view (first_name)",
+        "idx_contact_view_last_name": "contact_view (last_name)",
+        "idx_contact_view_group_id": "contact_view (group_id)",
+        "idx_contact_view_birth_year": "contact_view (birth_year)",
+        "idx_contact_view_birth_month_day": "contact_view (birth_month, birth_day)",
+        "idx_contact_view_birth_day": "contact_view (birth_day)",
+    }
+    # row of contact_view for contacts selected by WHERE appended to it
+    CONTACT_VIEW_ROW = """SELECT contact.id, contact.first_name, contact.last_name,
+            TRIM(COALESCE(contact.first_name, '') || ' ' || COALESCE(contact.last_name, '')),
+            contact.date_of_birth, contact.birth_year, contact.birth_month, contact.birth_day,
+            contact.group_id, contact_group.name, contact.street, contact.number_of_descriptive, contact.city,
+            ({numbers})
+        FROM contact
+        LEFT JOIN contact_group ON contact_group.id = contact.group_id"""
+    # '+420 777123456, +421 903123456' → ordered by the covering index (prefix, number)
+    CONTACT_VIEW_NUMBERS = """SELECT group_concat(COALESCE('+' || prefix.prefix || ' ', '') || phone_number.number, ', ')
+        FROM phone_number
+        LEFT JOIN prefix ON prefix.id = phone_number.prefix_id
+        WHERE phone_number.contact_id = {contact_id}"""
+    CONTACT_VIEW_TRIGGERS = {
+        "contact_view_contact_insert": """AFTER INSERT ON contact BEGIN
+            INSERT OR REPLACE INTO contact_view {row} WHERE contact.id = new.id;
+        END;""",
+        "contact_view_contact_update": """AFTER UPDATE ON contact BEGIN
+            DELETE FROM contact_view WHERE id = old.id;
+            INSERT OR REPLACE INTO contact_view {row} WHERE contact.id = new.id;
+        END;""",
+        "contact_view_contact_delete": """AFTER DELETE ON contact BEGIN
+            DELETE FROM contact_view WHERE id = old.id;
+        END;""",
+        "contact_view_group_insert": """AFTER INSERT ON contact_group BEGIN
+            UPDATE contact_view SET group_name = new.name WHERE group_id = new.id;
+        END;""",
+        "contact_view_group_update": """AFTER UPDATE ON contact_group BEGIN
+            UPDATE contact_view SET group_name = NULL WHERE group_id = old.id;
+            UPDATE contact_view SET group_name = new.name WHERE group_id = new.id;
+        END;""",
+        "contact_view_group_delete": """AFTER DELETE ON contact_group BEGIN
+            UPDATE contact_view SET group_name = NULL WHERE group_id = old.id;
+        END;""",
+        "contact_view_number_insert": """AFTER INSERT ON phone_number BEGIN
+            UPDATE contact_view SET numbers = ({new_numbers}) WHERE id = new.contact_id;
+        END;""",
+        "contact_view_number_update": """AFTER UPDATE ON phone_number BEGIN
+            UPDATE contact_view SET numbers = ({old_numbers}) WHERE id = old.contact_id;
+            UPDATE contact_view SET numbers = ({new_numbers}) WHERE id = new.contact_id;
+        END;""",
+        "contact_view_number_delete": """AFTER DELETE ON phone_number BEGIN
+            UPDATE contact_view SET numbers = ({old_numbers}) WHERE id = old.contact_id;
+        END;""",
+        "contact_view_prefix_insert": """AFTER INSERT ON prefix BEGIN
+            UPDATE contact_view SET numbers = ({view_numbers})
+            WHERE id IN (SELECT contact_id FROM phone_number WHERE prefix_id = new.id);
+        END;""",
+        "contact_view_prefix_update": """AFTER UPDATE ON prefix BEGIN
+            UPDATE contact_view SET numbers = ({view_numbers})
+            WHERE id IN (SELECT contact_id FROM phone_number WHERE prefix_id IN (old.id, new.id));
+        END;""",
+        "contact_view_prefix_delete": """AFTER DELETE ON prefix BEGIN
+            UPDATE contact_view SET numbers = ({view_numbers})
+            WHERE id IN (SELECT contact_id FROM phone_number WHERE prefix_id = old.id);
+        END;""",
+    }
+    # GLOB patterns of number search modes
+    NUMBER_PATTERNS = {
+        "contains": "*{}*",
+        "starts": "{}*",
+        "ends": "*{}",
+    }
+    EXIST_CHUNK_SIZE = 500  # ids in one existence query (sqlite has a limit of bound parameters)
+    # id ↔ name resolution, results are kept in the name cache
+    NAME_QUERIES = {
+        "group": "SELECT name FROM contact_group WHERE id = ?;",
+        "group_id": "SELECT id FROM contact_group WHERE name = ?;",
+        "prefix": "SELECT prefix FROM prefix WHERE id = ?;",
+        "prefix_id": "SELECT id FROM prefix WHERE prefix = ?;",
+        "contact": "SELECT TRIM(COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')) FROM contact WHERE id = ?;",
+    }
+    NAME_TABLES = {"group": "contact_group", "group_id": "contact_group", "prefix": "prefix", "prefix_id": "prefix", "contact": "contact"}
+    SEARCH_LIMIT = 50       # max ranked candidates of one fuzzy search
+    SEARCH_SIMILARITY = 0.3 # min share of the searched trigrams a name has to contain
+    read_only = False       # ContactSnapshot → True
+    # schema migrations in order → PRAGMA user_version is the number of applied ones (with MIGRATIONS_SKIPPED),
+    # a change of the schema is a new method appended here (never edit an applied one)
+    MIGRATIONS = (
+        "create_tables",
+        "create_birth_columns",
+        "create_indexes",
+        "create_name_search",
+        "create_number_search",
+        "insert_groups",
+    )
+    # flag added to PRAGMA user_version → a full-text migration was skipped by sqlite without fts5
+    # (searches fall back to LIKE), the migrations run again only when sqlite has fts5
+    MIGRATIONS_SKIPPED = 1 << 16
+
+    def __init__(self, db_path=None, durability=None, query_stats=None):
+        self.db_path = self.database_path(db_path)
+        self.durability = durability or os.environ.get("CONTACTDB_DURABILITY") or DURABILITY
+        if self.durability not in DURABILITY_PROFILES:
+            raise ValueError(f"unknown durability profile '{self.durability}', use one of {', '.join(DURABILITY_PROFILES)}")
+        # None → statistics by QUERY_STATS, False → no statistics
+        if query_stats is None and QUERY_STATS:
+            query_stats = QueryStats()
+        self.query_stats = query_stats or None
+        self.pool = ConnectionPool(self.db_path, DURABILITY_PROFILES[self.durability], self.query_stats)
+        self.connection = self.pool.writer
+        self.write_cursor = self.pool.writer_cursor
+        self.statements = {}
+        self.names = LRUCache(NAME_CACHE_SIZE)
+        self.results = LRUCache(RESULT_CACHE_SIZE)
+        self.generations = dict.fromkeys(self.TABLES, 0)
+        self.optional_tables = None
+        self.create_database()
+
+
+    ################
+    #  connection  #
+    ################
+
+    @staticmethod
+    def database_path(db_path=None):
+        """
+        Return: path of the database file (next to dbapp.py if none is given)
+        """
+        return Path(db_path) if db_path else Path(f"{Path(__file__).parent.resolve()}/{DB_PATH}{DB_NAME}")
+
+
+    @property
+    def cursor(self):
+        """
+        Cursor of the read connection of the calling thread
+        """
+        return self.pool.reader_cursor()
+
+
+    @contextlib.contextmanager
+    def reading(self):
+        """
+        Context manager → cursor for reading, every thread has its own connection
+        """
+        yield self.cursor
+
+
+    @contextlib.contextmanager
+    def writing(self, *tables):
+        """
+        Context manager → cursor of the one writer connection, only one thread writes at a time
+        Commit at the end, rollback if something fails
+        Cached results of the written tables (all tables if none are given) are dropped
+        """
+        with self.pool.lock:
+            try:
+                yield self.write_cursor
+            except BaseException:
+                self.connection.rollback()
+                raise
+            else:
+                self.connection.commit()
+            finally:
+                # after commit → a result loaded for the new generation is never older than the write
+                for table in tables or self.generations:
+                    self.generations[table] += 1
+
+
+    def fetch_all(self, statement, values, tables):
+        """
+        Execute read query, the result is cached until one of the tables is written
+        Return: rows
+        """
+        self.check_data_version()
+        key = (statement, tuple(values), tuple(self.generations[table] for table in tables))
+        rows = self.results.get(key, self.load_rows, cacheable=lambda rows: len(rows) <= RESULT_CACHE_MAX_ROWS)
+        return list(rows)
+
+
+    def load_rows(self, cache_key):
+        statement, values, _ = cache_key
+        cursor = self.cursor
+        cursor.execute(statement, values)
+        return cursor.fetchall()
+
+
+    def result_cache_stats(self):
+        """
+        Return: dict → hits, misses, evictions and size of the query result cache
+        """
+        return self.results.stats()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    ############
+    #  select  #
+    ############
+
+    def select(self, table, parameters: dict, operant="AND", similar=False):
+        """
+        Select rows equal to parameters, if there are none, rows similar to them
+        similar → only similar rows (LIKE '%value%')
+        Return: rows, valid, similar ("table" or "column", False, similar for unknown table or column)
+        """
+        if table not in self.TABLES:
+            return "table", False, similar
+
+        if similar:
+            where_param, values = self.where_clause(table, parameters, operant, similar)
+            if where_param is None:
+                return "column", False, similar
+            return self.fetch_all(f"SELECT {self.TABLES[table]} FROM {table}{where_param};", values, (table,)), True, similar
+
+        rows = self.search(table, parameters, operant)
+        if rows is None:
+            return "column", False, similar
+        data = [row[:-1] for row in rows if row[-1]]
+        if data: return data, True, False
+        return [row[:-1] for row in rows], True, True
+
+
+    def search(self, table, parameters: dict, operant="AND"):
+        """
+        Select rows equal to parameters and, only if there are none, rows similar to them
+        in one statement (the similar part is skipped as soon as something is equal)
+        Return: rows with exact flag as the last column (1 equal, 0 similar), None for unknown column
+        """
+        columns = self.TABLES[table]
+        exact, exact_values = self.where_clause(table, parameters, operant)
+        if exact is None:
+            return None
+        if not exact:
+            return self.fetch_all(f"SELECT {columns}, 1 FROM {table};", (), (table,))
+        similar, similar_values = self.where_clause(table, parameters, operant, similar=True)
+        qualified = ", ".join(f"{table}.{column}" for column in self.COLUMNS[table])
+        return self.fetch_all(
+            f"""SELECT {columns}, 1 FROM {table}{exact}
+            UNION ALL
+            SELECT {qualified}, 0 FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM {table}{exact})) AS gate
+            CROSS JOIN {table}{similar};""",
+            (*exact_values, *exact_values, *similar_values),
+            (table,)
+        )
+
+
+    def listing(self, table, parameters: dict = None, operant="AND"):
+        """
+        Select display-ready rows of the table in one statement
+        Ids of groups, prefixes and contacts are already joined to their names
+        Return: rows (empty list for unknown table or column)
+        """
+        listing = self.listing_sql(table)
+        if listing is None:
+            return []
+        where_param, values = self.where_clause(table, parameters, operant)
+        if where_param is None:
+            return []
+        return self.fetch_all(f"{listing}{where_param} ORDER BY {table}.id;", values, self.DEPENDENCIES[table])
+
+
+    def listing_sql(self, table):
+        """
+        Return: listing query of the table (from contact_view if it is turned on), None for unknown table
+        """
+        if table in self.VIEW_LISTINGS and self.contact_view:
+            return self.VIEW_LISTINGS[table]
+        return self.LISTINGS.get(table)
+
+
+    def page(self, table, parameters: dict = None, operant="AND", after=None, before=None, size=PAGE_SIZE):
+        """
+        One page of listing rows ordered by id (keyset pagination → every page costs the same)
+        after → page following given id, before → page preceding given id, none → first page
+        Return: rows (same columns as listing)
+        """
+        listing = self.listing_sql(table)
+        if listing is None:
+            return []
+        where_param, values = self.where_clause(table, parameters, operant)
+        if where_param is None:
+            return []
+        where_param += " AND " if where_param else " WHERE "
+        if before is not None:
+            return self.fetch_all(
+                f"{listing}{where_param}{table}.id < ? ORDER BY {table}.id DESC LIMIT ?;",
+                (*values, before, size),
+                self.DEPENDENCIES[table]
+            )[::-1]
+        return self.fetch_all(
+            f"{listing}{where_param}{table}.id > ? ORDER BY {table}.id LIMIT ?;",
+            (*values, after if after is not None else -1, size),
+            self.DEPENDENCIES[table]
+        )
+
+
+    def iter_listing(self, table, parameters: dict = None, operant="AND", chunk_size=EXPORT_CHUNK_SIZE, export=False):
+        """
+        Same rows as listing, but fetched in chunks → memory does not grow with the table
+        export → rows of EXPORTS (columns EXPORT_COLUMNS) where the table has them
+        Return: generator of rows
+        """
+        listing = self.EXPORTS.get(table) if export else None
+        listing = listing or self.listing_sql(table)
+        if listing is None:
+            return
+        where_param, values = self.where_clause(table, parameters, operant)
+        if where_param is None:
+            return
+        cursor = self.pool.reader().cursor()
+        try:
+            cursor.execute(f"{listing}{where_param} ORDER BY {table}.id;", values)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+
+    def where_clause(self, table, parameters, operant="AND", similar=False):
+        """
+        Build WHERE part of the query, columns are qualified with the table name
+        Return: where string, values (None, () if column does not exist)
+        """
+        if not parameters:
+            return "", ()
+
+        add_param = []
+        values = []
+        for column, value in parameters.items():
+            if column not in self.COLUMNS[table]:
+                return None, ()
+            if column == "date_of_birth":
+                # indexed generated columns, only the given parts → the planner can use the index of a single part
+                parts = [(f"{table}.{part_column} = ?", int(part)) for part_column, part in zip(self.BIRTH_COLUMNS, value[:3]) if part]
+                add_param.append("(" + " OR ".join(condition for condition, _ in parts) + ")" if parts else "0")
+                values.extend(part for _, part in parts)
+                continue
+            if similar:
+                add_param.append(f"{table}.{column} LIKE ?")
+                values.append(f"%{value}%")
+            else:
+                add_param.append(f"{table}.{column} = ?")
+                values.append(value)
+        return " WHERE (" + f" {operant} ".join(add_param) + ")", tuple(values)
+
+
+    ###########
+    #  names  #
+    ###########
+
+    def group_name(self, group_id):
+        """
+        Return: name of the group (None if it does not exist)
+        """
+        return self.resolve("group", group_id)
+
+
+    def group_id(self, name):
+        """
+        Return: id of the group with given name (None if it does not exist)
+        """
+        return self.resolve("group_id", name)
+
+
+    def prefix(self, prefix_id):
+        """
+        Return: prefix with given id (None if it does not exist)
+        """
+        return self.resolve("prefix", prefix_id)
+
+
+    def prefix_id(self, prefix):
+        """
+        Return: id of the prefix (None if it does not exist)
+        """
+        return self.resolve("prefix_id", prefix)
+
+
+    def contact_name(self, contact_id):
+        """
+        Return: first name and last name of the contact (None if it does not exist)
+        """
+        return self.resolve("contact", contact_id)
+
+
+    def resolve(self, kind, key):
+        """
+        Id ↔ name lookup through the LRU cache
+        Cached names are dropped by every write of the table and by writes of other processes (PRAGMA data_version)
+        """
+        self.check_data_version()
+        return self.names.get((kind, key, self.generations[self.NAME_TABLES[kind]]), self.load_name)
+
+
+    def load_name(self, cache_key):
+        kind, key, _ = cache_key
+        cursor = self.cursor
+        cursor.execute(self.NAME_QUERIES[kind], (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+    def check_data_version(self):
+        """
+        Clear the name and result caches if other connection changed the database,
+        checked before every cached read on the read connection of the calling thread
+        (PRAGMA data_version takes microseconds and does not wait for a running write)
+        """
+        if self.pool.data_changed():
+            self.names.clear()
+            self.results.clear()
+            self.optional_tables = None
+
+
+    def name_cache_stats(self):
+        """
+        Return: dict → hits, misses, evictions and size of the name cache
+        """
+        return self.names.stats()
+
+
+    def statement_stats(self):
+        """
+        Return: rows of QueryStats.COLUMNS for every executed statement shape (empty without statistics)
+        """
+        return self.query_stats.rows() if self.query_stats else []
+
+
+    ###########
+    #  exist  #
+    ###########
+
+    def exists(self, table, id_to_check):
+        """
+        Check if row with given id exists → one primary key lookup
+        Return: True or False
+        """
+        if table not in self.TABLES:
+            return False
+        if table == "contact_group":
+            return self.group_name(id_to_check) is not None
+        if table == "prefix":
+            return self.prefix(id_to_check) is not None
+        self.cursor.execute(f"SELECT 1 FROM {table} WHERE id = ?;", (id_to_check,))
+        return self.cursor.fetchone() is not None
+
+
+    def existing_ids(self, table, ids_to_check):
+        """
+        Check which of given ids exist, in chunks of EXIST_CHUNK_SIZE ids per query
+        Return: set of existing ids
+        """
+        if table not in self.TABLES:
+            return set()
+        ids_to_check = list(ids_to_check)
+        found = set()
+        for i in range(0, len(ids_to_check), self.EXIST_CHUNK_SIZE):
+            chunk = ids_to_check[i:i + self.EXIST_CHUNK_SIZE]
+            self.cursor.execute(f"SELECT id FROM {table} WHERE id IN ({', '.join('?' * len(chunk))});", chunk)
+            found.update(row[0] for row in self.cursor.fetchall())
+        return found
+
+
+    ###########
+    #  write  #
+    ###########
+
+    def insert(self, table, parameters: dict):
+        """
+        Insert one row
+        Return: id of the new row (None for unknown table or column)
+        """
+        statement = self.write_statement("insert", table, tuple(parameters))
+        if statement is None:
+            return None
+        with self.writing(table) as cursor:
+            cursor.execute(statement, tuple(parameters.values()))
+            return cursor.lastrowid
+
+
+    def update(self, table, parameters: dict, id_to_update):
+        """
+        Update one row
+        Return: number of updated rows (None for unknown table or column)
+        """
+        statement = self.write_statement("update", table, tuple(parameters))
+        if statement is None:
+            return None
+        if not parameters:
+            return 0
+        with self.writing(table) as cursor:
+            cursor.execute(statement, (*parameters.values(), id_to_update))
+            return cursor.rowcount
+
+
+    def delete(self, table, id_to_delete):
+        """
+        Delete one row
+        Return: number of deleted rows (None for unknown table)
+        """
+        statement = self.write_statement("delete", table)
+        if statement is None:
+            return None
+        with self.writing(table) as cursor:
+            cursor.execute(statement, (id_to_delete,))
+            return cursor.rowcount
+
+
+    def insert_many(self, table, rows):
+        """
+        Insert rows (dicts) in one transaction, rows with the same columns are inserted together
+        Return: number of inserted rows (None for unknown table or column)
+        """
+        count = 0
+        with self.writing(table) as cursor:
+            for columns, group in itertools.groupby(rows, key=lambda row: tuple(row)):
+                statement = self.write_statement("insert", table, columns)
+                if statement is None:
+                    self.connection.rollback()
+                    return None
+                cursor.executemany(statement, (tuple(row.values()) for row in group))
+                count += cursor.rowcount
+        return count
+
+
+    def update_many(self, table, updates):
+        """
+        Update rows in one transaction, updates → iterable of (parameters, id_to_update)
+        Return: number of updated rows (None for unknown table or column)
+        """
+        count = 0
+        with self.writing(table) as cursor:
+            for columns, group in itertools.groupby(updates, key=lambda update: tuple(update[0])):
+                statement = self.write_statement("update", table, columns)
+                if statement is None:
+                    self.connection.rollback()
+                    return None
+                if not columns:
+                    continue
+                cursor.executemany(statement, ((*parameters.values(), id_to_update) for parameters, id_to_update in group))
+                count += cursor.rowcount
+        return count
+
+
+    def delete_many(self, table, ids_to_delete):
+        """
+        Delete rows with given ids in one transaction
+        Return: number of deleted rows (None for unknown table)
+        """
+        statement = self.write_statement("delete", table)
+        if statement is None:
+            return None
+        with self.writing(table) as cursor:
+            cursor.executemany(statement, ((id_to_delete,) for id_to_delete in ids_to_delete))
+            return cursor.rowcount
+
+
+    def write_statement(self, kind, table, columns=()):
+        """
+        SQL with bound parameters for insert, update or delete,
+        the same columns always give the same SQL → sqlite reuses the prepared statement
+        Return: SQL (None for unknown table or column)
+        """
+        key = (kind, table, columns)
+        if key in self.statements:
+            return self.statements[key]
+        if table not in self.TABLES:
+            return None
+        if any(column not in self.COLUMNS[table] for column in columns):
+            return None
+        if kind == "insert" and not columns:
+            statement = f"INSERT INTO {table} DEFAULT VALUES;"
+        elif kind == "insert":
+            statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});"
+        elif kind == "update":
+            statement = f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?;"
+        else:
+            statement = f"DELETE FROM {table} WHERE id = ?;"
+        self.statements[key] = statement
+        return statement
+
+
+    def configure(self, pragmas: dict):
+        """
+        Set PRAGMAs (journal mode, synchronous, cache...) of all connections
+        """
+        self.pool.configure(pragmas)
+
+
+    def settings(self):
+        """
+        Return: dict of current values of the profile PRAGMAs (of the writer connection)
+        """
+        values = {}
+        with self.pool.lock:
+            for pragma in DURABILITY_PROFILES[DURABILITY]:
+                self.write_cursor.execute(f"PRAGMA {pragma};")
+                values[pragma] = self.write_cursor.fetchone()[0]
+        return values
+
+
+    def create_database(self):
+        """
+        Bring the database schema to the current version by running the missing migrations,
+        an up-to-date database costs one PRAGMA read
+        """
+        if self.schema_current(*self.schema_state()):
+            return
+        with self.pool.lock:
+            self.write_cursor.execute("BEGIN IMMEDIATE;")
+            try:
+                # another process could have migrated the database before the lock was taken
+                version, skipped = self.schema_state()
+                if skipped and not self.schema_current(version, skipped):
+                    # sqlite has fts5 now → all migrations again, each of them can run again
+                    version = 0
+                skipped = False
+                for migration in self.MIGRATIONS[version:]:
+                    # failed full-text migration → the following ones still run, the skip is recorded
+                    if getattr(self, migration)() is False:
+                        skipped = True
+                self.write_cursor.execute(f"PRAGMA user_version = {len(self.MIGRATIONS) | (self.MIGRATIONS_SKIPPED if skipped else 0)};")
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+            self.optional_tables = None
+
+
+    def schema_state(self):
+        """
+        Return: number of migrations applied to the database, True if a full-text migration was skipped
+        """
+        self.write_cursor.execute("PRAGMA user_version;")
+        user_version = self.write_cursor.fetchone()[0]
+        return user_version & ~self.MIGRATIONS_SKIPPED, bool(user_version & self.MIGRATIONS_SKIPPED)
+
+
+    def schema_current(self, version, skipped):
+        """
+        Return: True if no migration has to run (skipped ones only if sqlite of this process has fts5)
+        """
+        return version >= len(self.MIGRATIONS) and not (skipped and self.fts5_available())
+
+
+    def schema_version(self):
+        """
+        Return: number of migrations applied to the database
+        """
+        return self.schema_state()[0]
+
+
+    @staticmethod
+    @functools.cache
+    def fts5_available():
+        """
+        Return: True if sqlite has fts5 (checked once per process on an in-memory database)
+        """
+        with contextlib.closing(sqlite3.connect(":memory:")) as connection:
+            try:
+                connection.execute("CREATE VIRTUAL TABLE fts5_check USING fts5(text);")
+            except sqlite3.OperationalError:
+                return False
+        return True
+
+
+    def create_tables(self):
+        """
+        Create database tables if not already exists
+        """
+        tables = [
+            """CREATE TABLE IF NOT EXISTS 'contact_group' (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name VARCHAR(255) NOT NULL UNIQUE)
+                ;
+            """,
+            """CREATE TABLE IF NOT EXISTS 'contact' (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_name VARCHAR(60),
+                last_name VARCHAR(60),
+                date_of_birth DATE,
+                group_id INTEGER,
+                street VARCHAR(60),
+                number_of_descriptive INTEGER,
+                city VARCHAR(60),
+                FOREIGN KEY (group_id)
+                    REFERENCES contact_group(id)
+                );
+            """,
+            """CREATE TABLE IF NOT EXISTS 'prefix' (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prefix INTEGER NOT NULL UNIQUE,
+                state VARCHAR(255) NOT NULL UNIQUE
+                );
+            """,
+            """CREATE TABLE IF NOT EXISTS 'phone_number' (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prefix_id INTEGER NOT NULL DEFAULT 420,
+                number INTEGER NOT NULL,
+                contact_id INTEGER,
+                FOREIGN KEY (prefix_id)
+                    REFERENCES prefix(id),
+                FOREIGN KEY (contact_id)
+                    REFERENCES contact(id)
+                );
+            """,
+        ]
+        for table in tables:
+            self.write_cursor.execute(table)
+
+
+    def insert_groups(self):
+        """
+        Insert default groups (a group is skipped if its id or name is already taken)
+        """
+        self.write_cursor.execute("INSERT OR IGNORE INTO contact_group (id, name) VALUES (1, 'family'), (2, 'friends'), (3, 'work');")
+
+
+    ###########
+    #  dates  #
+    ###########
+
+    def create_birth_columns(self):
+        """
+        Add generated year, month and day of birth columns to contact if not already exists
+        """
+        self.write_cursor.execute("PRAGMA table_xinfo(contact);")
+        columns = [row[1] for row in self.write_cursor.fetchall()]
+        for column, definition in self.BIRTH_COLUMNS.items():
+            if column not in columns:
+                self.write_cursor.execute(f"ALTER TABLE contact ADD COLUMN {column} {definition};")
+
+
+    def contacts_by_numbers(self, numbers):
+        """
+        Select owners of given phone numbers (exact match), many numbers in one query
+        Return: dict → {number: rows (same columns as listing)}
+        """
+        numbers = list(numbers)
+        found = {number: [] for number in numbers}
+        for i in range(0, len(numbers), self.EXIST_CHUNK_SIZE):
+            chunk = numbers[i:i + self.EXIST_CHUNK_SIZE]
+            self.cursor.execute(
+                f"""SELECT phone_number.number, owner.* FROM phone_number
+                JOIN ({self.listing_sql("contact")}) AS owner ON owner.id = phone_number.contact_id
+                WHERE phone_number.number IN ({', '.join('?' * len(chunk))})
+                ORDER BY owner.id;""",
+                chunk
+            )
+            for number, *row in self.cursor.fetchall():
+                found.setdefault(number, []).append(tuple(row))
+        return found
+
+
+    def upcoming_birthdays(self, days, today=None):
+        """
+        Select contacts with birthday in the next given number of days (today included)
+        Return: rows (same columns as listing) ordered by the next birthday
+        """
+        today = today or datetime.date.today()
+        start = (today.month, today.day)
+        if days >= 365:
+            condition = "1"
+            values = []
+        else:
+            last = today + datetime.timedelta(days=days)
+            end = (last.month, last.day)
+            joiner = "AND" if start <= end else "OR"
+            condition = f"(contact.birth_month, contact.birth_day) >= (?, ?) {joiner} (contact.birth_month, contact.birth_day) <= (?, ?)"
+            values = [*start, *end]
+        return self.fetch_all(
+            f"""{self.listing_sql("contact")}
+            WHERE contact.birth_month IS NOT NULL AND ({condition})
+            ORDER BY (contact.birth_month, contact.birth_day) < (?, ?), contact.birth_month, contact.birth_day, contact.id;""",
+            (*values, *start),
+            self.DEPENDENCIES["contact"]
+        )
+
+
+    #############
+    #  indexes  #
+    #############
+
+    def create_indexes(self):
+        """
+        Create secondary indexes if not already exists
+        """
+        for name, columns in self.INDEXES.items():
+            self.write_cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns};")
+
+
+    def indexes(self):
+        """
+        Return: list of (index name, table name, sql) for every index in the database
+        """
+        self.cursor.execute("SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' ORDER BY tbl_name, name;")
+        return self.cursor.fetchall()
+
+
+    def rebuild_indexes(self, name=None):
+        """
+        Rebuild one index (or all when name is not given) and create missing ones
+        Indexes of contact_view are known only while it is turned on
+        Return: False for unknown index
+        """
+        contact_view = self.contact_view
+        if name is not None and name not in self.INDEXES and not (contact_view and name in self.CONTACT_VIEW_INDEXES):
+            return False
+        with self.writing() as cursor:
+            self.create_indexes()
+            if contact_view:
+                self.create_contact_view_indexes()
+            cursor.execute(f"REINDEX {name};" if name else "REINDEX;")
+        return True
+
+
+    def analyze(self):
+        """
+        Gather statistics for the query planner
+        """
+        with self.writing() as cursor:
+            cursor.execute("ANALYZE;")
+
+
+    ##################
+    #  contact view  #
+    ##################
+
+    def create_contact_view(self):
+        """
+        Turn on contact_view → create it with its indexes and triggers and fill it from the tables
+        (creating it again rebuilds its rows)
+        """
+        row = self.CONTACT_VIEW_ROW.format(numbers=self.CONTACT_VIEW_NUMBERS.format(contact_id="contact.id"))
+        numbers = {
+            "row": row,
+            "new_numbers": self.CONTACT_VIEW_NUMBERS.format(contact_id="new.contact_id"),
+            "old_numbers": self.CONTACT_VIEW_NUMBERS.format(contact_id="old.contact_id"),
+            "view_numbers": self.CONTACT_VIEW_NUMBERS.format(contact_id="contact_view.id"),
+        }
+        with self.writing() as cursor:
+            cursor.execute(self.CONTACT_VIEW)
+            self.create_contact_view_indexes()
+            for name, trigger in self.CONTACT_VIEW_TRIGGERS.items():
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger.format(**numbers)}")
+            cursor.execute("DELETE FROM contact_view;")
+            cursor.execute(f"INSERT INTO contact_view {row};")
+        self.optional_tables = None
+
+
+    def create_contact_view_indexes(self):
+        """
+        Create indexes of contact_view if not already exists
+        """
+        for name, columns in self.CONTACT_VIEW_INDEXES.items():
+            self.write_cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns};")
+
+
+    def drop_contact_view(self):
+        """
+        Turn off contact_view → listings are read from the tables again
+        """
+        with self.writing() as cursor:
+            for name in self.CONTACT_VIEW_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name};")
+            cursor.execute("DROP TABLE IF EXISTS contact_view;")
+        self.optional_tables = None
+
+
+    ############
+    #  search  #
+    ############
+
+    def create_name_search(self):
+        """
+        Create full-text index on contact names (needs sqlite with fts5)
+        Existing contacts are indexed when the index is created for the first time
+        Return: False if sqlite has no fts5
+        """
+        self.write_cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'contact_search';")
+        exists = self.write_cursor.fetchone()
+        try:
+            for statement in self.NAME_SEARCH:
+                self.write_cursor.execute(statement)
+        except sqlite3.OperationalError:
+            return False
+        if not exists:
+            self.write_cursor.execute("INSERT INTO contact_search (contact_search) VALUES ('rebuild');")
+
+
+    def create_number_search(self):
+        """
+        Create full-text index on phone number digits (needs sqlite with fts5)
+        Existing numbers are indexed when the index is created for the first time
+        Return: False if sqlite has no fts5
+        """
+        self.write_cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'number_search';")
+        exists = self.write_cursor.fetchone()
+        try:
+            for statement in self.NUMBER_SEARCH:
+                self.write_cursor.execute(statement)
+        except sqlite3.OperationalError:
+            return False
+        if not exists:
+            self.write_cursor.execute("INSERT INTO number_search (rowid, digits) SELECT id, CAST(number AS TEXT) FROM phone_number;")
+
+
+    @property
+    def name_search(self):
+        """
+        True if there is the full-text index on contact names
+        """
+        return "contact_search" in self.load_optional_tables()
+
+
+    @property
+    def number_search(self):
+        """
+        True if there is the full-text index on phone number digits
+        """
+        return "number_search" in self.load_optional_tables()
+
+
+    @property
+    def contact_view(self):
+        """
+        True if contact_view is turned on → contact listings are read from it
+        """
+        return "contact_view" in self.load_optional_tables()
+
+
+    def load_optional_tables(self):
+        """
+        Return: names of existing full-text indexes and contact_view
+        (looked up on the first use and again after other process changed the database)
+        """
+        self.check_data_version()
+        if self.optional_tables is None:
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('contact_search', 'number_search', 'contact_view');")
+            self.optional_tables = {row[0] for row in self.cursor.fetchall()}
+        return self.optional_tables
+
+
+    def search_number(self, digits, mode="contains", prefix_id=None):
+        """
+        Select contacts owning a phone number that contains, starts or ends with given digits
+        Patterns with at least 3 digits are answered from the trigram index
+        Return: rows (same columns as listing)
+        """
+        pattern = self.NUMBER_PATTERNS[mode].format(digits)
+        if self.number_search:
+            # CROSS JOIN keeps the full-text index as the outer loop → the planner would otherwise
+            # scan phone_number (or its prefix index) and run the GLOB once per row
+            numbers = """SELECT phone_number.contact_id FROM number_search
+                CROSS JOIN phone_number ON phone_number.id = number_search.rowid
+                WHERE number_search.digits GLOB ?"""
+        else:
+            numbers = """SELECT phone_number.contact_id FROM phone_number
+                WHERE CAST(phone_number.number AS TEXT) GLOB ?"""
+        values = [pattern]
+        if prefix_id is not None:
+            numbers += " AND phone_number.prefix_id = ?"
+            values.append(prefix_id)
+        return self.fetch_all(
+            f"{self.listing_sql('contact')} WHERE contact.id IN ({numbers}) ORDER BY contact.id;",
+            values,
+            (*self.DEPENDENCIES["contact"], "phone_number")
+        )
+
+
+    def search_name(self, name):
+        """
+        Select contacts with first name or last name equal to given name,
+        if there are none, select similar ones ranked from the most similar
+        Return: rows (same columns as listing), similar
+        """
+        rows = self.search_contacts(name)
+        if rows and rows[0][-1]:
+            return [row[:-1] for row in rows], False
+
+        searched = self.trigrams(name, fold=True)
+        similar_rows = []
+        for row in rows:
+            found = self.trigrams(row[1] or "", fold=True) | self.trigrams(row[2] or "", fold=True)
+            if not searched or len(searched & found) / len(searched) >= self.SEARCH_SIMILARITY:
+                similar_rows.append(row[:-1])
+        return similar_rows, True
+
+
+    def search_contacts(self, name):
+        """
+        Select contacts by name in one ranked statement:
+        equal first or last name → name contains given name → names share trigrams with it (typos),
+        every next kind is searched only if the previous ones found nothing, only trigram candidates are limited (SEARCH_LIMIT)
+        Return: rows (same columns as listing) with exact flag as the last column (1 equal, 0 similar)
+        """
+        exact = "SELECT id FROM contact WHERE first_name = ? UNION SELECT id FROM contact WHERE last_name = ?"
+        gate = "(SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM exact)) AS gate CROSS JOIN"
+        trigrams = self.trigrams(name)
+        if self.name_search and trigrams:
+            # every name containing the searched one, only typo candidates (any shared trigram) are capped
+            contains = f"SELECT contact_search.rowid AS id, contact_search.rank AS rank FROM {gate} contact_search WHERE contact_search MATCH ?"
+            similar = """SELECT contact_search.rowid AS id, contact_search.rank AS rank
+                FROM (SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM exact) AND NOT EXISTS (SELECT 1 FROM contains)) AS gate
+                CROSS JOIN contact_search WHERE contact_search MATCH ? ORDER BY rank LIMIT ?"""
+            values = (
+                name, name,
+                self.quote_fts(name),
+                " OR ".join(self.quote_fts(t) for t in sorted(trigrams)), self.SEARCH_LIMIT
+            )
+        else:
+            # too short for trigrams or sqlite without fts5 → LIKE '%name%'
+            contains = f"SELECT contact.id AS id, 0 AS rank FROM {gate} contact WHERE contact.first_name LIKE ? OR contact.last_name LIKE ?"
+            similar = "SELECT NULL AS id, NULL AS rank WHERE 0"
+            values = (name, name, f"%{name}%", f"%{name}%")
+        return self.fetch_all(
+            f"""WITH exact AS ({exact}),
+            contains AS ({contains}),
+            similar AS ({similar}),
+            found AS (
+                SELECT id, 0 AS level, 0 AS rank FROM exact
+                UNION ALL SELECT id, 1, rank FROM contains
+                UNION ALL SELECT id, 2, rank FROM similar
+            )
+            SELECT owner.*, found.level = 0 FROM found
+            JOIN ({self.listing_sql("contact")}) AS owner ON owner.id = found.id
+            ORDER BY found.level, found.rank, owner.id;""",
+            values,
+            self.DEPENDENCIES["contact"]
+        )
+
+
+    @staticmethod
+    def trigrams(text, fold=False):
+        """
+        Return: set of lowercase trigrams of the text (same as fts5 trigram tokenizer)
+        fold → without diacritics, so 'Dvorak' is similar to 'Dvořák'
+        """
+        text = text.lower()
+        if fold:
+            text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+    @staticmethod
+    def quote_fts(text):
+        """
+        Return: text as fts5 string literal
+        """
+        return '"' + text.replace('"', '""') + '"'
+
+
+    ############
+    #  import  #
+    ############
+
+    def import_rows(self, table, rows, batch_size=IMPORT_BATCH_SIZE):
+        """
+        Insert rows (dicts) into the table, one transaction for every batch of rows
+        Foreign keys are checked against ids loaded into memory once
+        Return: number of imported rows, number of rejected rows
+        """
+        columns = self.COLUMNS[table]
+        known = self.import_keys(table)
+        statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});"
+        imported = rejected = 0
+        batch = []
+        for row in rows:
+            values = self.import_values(table, row, known)
+            if values is None:
+                rejected += 1
+                continue
+            batch.append(tuple(values.get(column) for column in columns))
+            if len(batch) >= batch_size:
+                done = self.import_batch(statement, batch)
+                imported, rejected = imported + done, rejected + len(batch) - done
+                batch = []
+        if batch:
+            done = self.import_batch(statement, batch)
+            imported, rejected = imported + done, rejected + len(batch) - done
+        return imported, rejected
+
+
+    def import_batch(self, statement, batch):
+        """
+        Insert batch of rows in one transaction,
+        if some row breaks a constraint, insert the rows one by one and skip the wrong ones
+        Return: number of inserted rows
+        """
+        try:
+            with self.writing() as cursor:
+                cursor.executemany(statement, batch)
+            return len(batch)
+        except sqlite3.IntegrityError:
+            pass
+        done = 0
+        with self.writing() as cursor:
+            for values in batch:
+                try:
+                    cursor.execute(statement, values)
+                    done += 1
+                except sqlite3.IntegrityError:
+                    pass
+        return done
+
+
+    def import_keys(self, table):
+        """
+        Load ids (and names) the imported rows may refer to
+        Return: dict → {"group": {name: id}, "group_id": {id}, "prefix": {prefix: id}, "prefix_id": {id}, "contact": {id}}
+        """
+        known = {}
+        if table == "contact":
+            self.cursor.execute("SELECT name, id FROM contact_group;")
+            known["group"] = dict(self.cursor.fetchall())
+            known["group_id"] = set(known["group"].values())
+        elif table == "phone_number":
+            self.cursor.execute("SELECT prefix, id FROM prefix;")
+            known["prefix"] = dict(self.cursor.fetchall())
+            known["prefix_id"] = set(known["prefix"].values())
+            self.cursor.execute("SELECT id FROM contact;")
+            known["contact"] = {row[0] for row in self.cursor.fetchall()}
+        return known
+
+
+    def import_values(self, table, row, known):
+        """
+        Convert imported row to column values, group and prefix may be given by name
+        Return: dict → {column: value} or None if the row is not valid
+        """
+        row = {str(key).strip().lower(): (value.strip() if isinstance(value, str) else value) for key, value in row.items()}
+        row = {key: value for key, value in row.items() if value not in ("", None)}
+        try:
+            values = {"id": self.import_int(row.get("id"))}
+            if table == "contact":
+                values["first_name"] = row.get("first_name")
+                values["last_name"] = row.get("last_name")
+                values["date_of_birth"] = self.import_date(row.get("date_of_birth"))
+                values["street"] = row.get("street")
+                values["number_of_descriptive"] = self.import_int(row.get("number_of_descriptive"))
+                values["city"] = row.get("city")
+                group_id = self.import_int(row.get("group_id"))
+                if group_id is None and "group" in row:
+                    group_id = known["group"].get(row["group"])
+                    if group_id is None:
+                        return None
+                if group_id is not None and group_id not in known["group_id"]:
+                    return None
+                values["group_id"] = group_id
+
+            elif table == "phone_number":
+                values["number"] = self.import_int(row.get("number"))
+                prefix_id = self.import_int(row.get("prefix_id"))
+                if prefix_id is None:
+                    prefix_id = known["prefix"].get(self.import_int(str(row.get("prefix", "")).lstrip("+")))
+                contact_id = self.import_int(row.get("contact_id"))
+                if values["number"] is None or prefix_id not in known["prefix_id"]:
+                    return None
+                if contact_id is not None and contact_id not in known["contact"]:
+                    return None
+                values["prefix_id"] = prefix_id
+                values["contact_id"] = contact_id
+
+            elif table == "contact_group":
+                values["name"] = row.get("name")
+                if values["name"] is None:
+                    return None
+
+            elif table == "prefix":
+                values["prefix"] = self.import_int(str(row.get("prefix", "")).lstrip("+"))
+                values["state"] = row.get("state")
+                if values["prefix"] is None or values["state"] is None:
+                    return None
+        except ValueError:
+            return None
+        return values
+
+
+    @staticmethod
+    def import_int(value):
+        """
+        Return: value as int, None for empty value (ValueError if it is not a number)
+        """
+        if value in ("", None):
+            return None
+        return int(value)
+
+
+    @staticmethod
+    def import_date(value):
+        """
+        Return: date in format YYYY-MM-DD (given as YYYY-MM-DD or YYYY/MM/DD), None for empty value
+        """
+        if value in ("", None):
+            return None
+        return datetime.date(*map(int, str(value).replace("/", "-").split("-"))).isoformat()
+
+
+    def close(self):
+        self.pool.close()
+
+
+##########################
+#  AsyncContactDatabase  #
+##########################
+
+class AsyncContactDatabase:
+    """
+    asyncio facade of ContactDatabase → every query runs in a bounded pool of threads,
+    so the event loop never waits for sqlite
+    Lookups by number started in the same loop iteration are answered by one query
+    """
+    def __init__(self, db_path=None, durability=None, workers=ASYNC_WORKERS):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.db = ContactDatabase(db_path, durability)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="contactdb")
+        self.pending_numbers = {}
+
+
+    async def run(self, method, *args, **kwargs):
+        """
+        Run a ContactDatabase method in the pool
+        Return: its result
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+
+    async def find_by_number(self, number):
+        """
+        Select owners of the phone number (exact match), batched with other pending lookups
+        Return: rows (same columns as listing)
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.pending_numbers:
+            loop.call_soon(self.flush_numbers, loop)
+        self.pending_numbers.setdefault(int(number), []).append(future)
+        return await future
+
+
+    def flush_numbers(self, loop):
+        """
+        Send all pending number lookups to the pool as one query
+        """
+        pending, self.pending_numbers = self.pending_numbers, {}
+        task = loop.run_in_executor(self.executor, self.db.contacts_by_numbers, list(pending))
+
+        def resolve(task):
+            error = task.exception()
+            for number, futures in pending.items():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if error:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(task.result().get(number, []))
+        task.add_done_callback(resolve)
+
+
+    async def select(self, table, parameters: dict, operant="AND", similar=False):
+        return await self.run(self.db.select, table, parameters, operant, similar)
+
+
+    async def listing(self, table, parameters: dict = None, operant="AND"):
+        return await self.run(self.db.listing, table, parameters, operant)
+
+
+    async def page(self, table, parameters: dict = None, operant="AND", after=None, before=None, size=PAGE_SIZE):
+        return await self.run(self.db.page, table, parameters, operant, after, before, size)
+
+
+    async def search_name(self, name):
+        return await self.run(self.db.search_name, name)
+
+
+    async def search_number(self, digits, mode="contains", prefix_id=None):
+        return await self.run(self.db.search_number, digits, mode, prefix_id)
+
+
+    async def upcoming_birthdays(self, days, today=None):
+        return await self.run(self.db.upcoming_birthdays, days, today)
+
+
+    async def exists(self, table, id_to_check):
+        return await self.run(self.db.exists, table, id_to_check)
+
+
+    async def insert(self, table, parameters: dict):
+        return await self.run(self.db.insert, table, parameters)
+
+
+    async def update(self, table, parameters: dict, id_to_update):
+        return await self.run(self.db.update, table, parameters, id_to_update)
+
+
+    async def delete(self, table, id_to_delete):
+        return await self.run(self.db.delete, table, id_to_delete)
+
+
+    async def close(self):
+        """
+        Wait for running queries and close all connections
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.executor.shutdown)
+        self.db.close()
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+#####################
+#  ContactSnapshot  #
+#####################
+
+class ContactRecord:
+    """
+    One contact of ContactSnapshot → slots instead of a dict for every record
+    """
+    __slots__ = (
+        "id", "first_name", "last_name", "date_of_birth", "group_id", "street", "number_of_descriptive", "city",
+        "birth_year", "birth_month", "birth_day",
+    )
+
+    def __init__(self, row):
+        (
+            self.id, self.first_name, self.last_name, self.date_of_birth, self.group_id, self.street,
+            self.number_of_descriptive, self.city, self.birth_year, self.birth_month, self.birth_day
+        ) = row
+
+
+class ContactSnapshot:
+    """
+    Read-only copy of the whole database in memory (for deployments where the data does not change)
+    Contacts are slotted records sharing one object for every repeated value, phone numbers are columns of int arrays,
+    names, groups and parts of date of birth have hash indexes (key → positions of contacts in id order)
+    Reading methods return the same rows as ContactDatabase, so App lists from it without any statement
+    """
+    read_only = True
+    query_stats = None
+    # parts of date of birth computed like the generated columns → works on databases of any schema version
+    CONTACTS = """SELECT id, first_name, last_name, date_of_birth, group_id, street, number_of_descriptive, city,
+        CAST(strftime('%Y', date_of_birth) AS INTEGER), CAST(strftime('%m', date_of_birth) AS INTEGER),
+        CAST(strftime('%d', date_of_birth) AS INTEGER) FROM contact ORDER BY id;"""
+    NUMBERS = "SELECT id, prefix_id, number, contact_id FROM phone_number ORDER BY id;"
+    INTEGER_COLUMNS = {"id", "group_id", "number_of_descriptive", "prefix_id", "number", "contact_id", "prefix"}
+    BM25_K1 = 1.2   # same parameters as bm25() of fts5
+    BM25_B = 0.75
+    LIKE_FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")  # LIKE of sqlite folds only ASCII
+
+    def __init__(self, db_path=None):
+        start = time.perf_counter()
+        path = ContactDatabase.database_path(db_path).resolve()
+        if not path.exists():
+            raise FileNotFoundError(f"database {path} does not exist")
+        # read-only connection without migrations or PRAGMAs → works on files the user cannot write,
+        # a WAL database in a directory without write access cannot get its -shm file → opened as immutable,
+        # but only without a -wal file (immutable skips committed pages in it, nobody can be writing without it)
+        wal = Path(f"{path}-wal")
+        for parameters in ("mode=ro", "mode=ro&immutable=1"):
+            connection = sqlite3.connect(f"{path.as_uri()}?{parameters}", uri=True)
+            try:
+                self.load(connection.cursor())
+                break
+            except sqlite3.OperationalError:
+                if parameters.endswith("immutable=1") or (wal.exists() and wal.stat().st_size):
+                    raise
+            finally:
+                connection.close()
+        self.load_time = time.perf_counter() - start
+
+
+    ##########
+    #  load  #
+    ##########
+
+    def load(self, cursor):
+        """
+        Copy all tables in chunks and build the indexes
+        """
+        cursor.execute("SELECT id, name FROM contact_group ORDER BY id;")
+        self.groups = dict(cursor.fetchall())
+        self.group_ids = {name: group_id for group_id, name in self.groups.items()}
+        cursor.execute("SELECT id, prefix, state FROM prefix ORDER BY id;")
+        self.prefixes = {prefix_id: (prefix, state) for prefix_id, prefix, state in cursor.fetchall()}
+        self.prefix_ids = {prefix: prefix_id for prefix_id, (prefix, _) in self.prefixes.items()}
+
+        self.contacts = []
+        self.contact_ids = array.array("q")
+        self.first_names = {}
+        self.last_names = {}
+        self.name_tokens = None                     # number of trigrams in all names → counted by the first ranked search
+        self.contact_index = {
+            "group_id": {}, "birth_year": {}, "birth_month": {}, "birth_day": {}, "birthday": {},
+        }
+        # one object for every repeated value (names, streets, dates, years ...), ids are unique anyway
+        shared = {}
+        cursor.execute(self.CONTACTS)
+        for rows in iter(functools.partial(cursor.fetchmany, EXPORT_CHUNK_SIZE), []):
+            for contact_id, *values in rows:
+                self.add_contact(ContactRecord([contact_id, *(shared.setdefault(value, value) for value in values)]))
+
+        self.number_ids = array.array("q")
+        self.number_prefixes = array.array("q")     # 0 → NULL
+        self.numbers = array.array("q")
+        self.number_contacts = array.array("q")     # 0 → NULL
+        # numbers of a contact are not indexed → a dict with an array for every contact would triple the memory per contact
+        self.number_index = {"prefix_id": {}}
+        cursor.execute(self.NUMBERS)
+        for rows in iter(functools.partial(cursor.fetchmany, EXPORT_CHUNK_SIZE), []):
+            for number_id, prefix_id, number, contact_id in rows:
+                self.add_position(self.number_index["prefix_id"], prefix_id, len(self.numbers))
+                self.number_ids.append(number_id)
+                self.number_prefixes.append(prefix_id or 0)
+                self.numbers.append(number)
+                self.number_contacts.append(contact_id or 0)
+        cursor.close()
+        self.index_numbers()
+        self.memory = self.size(shared.values())
+
+
+    def add_contact(self, record):
+        position = len(self.contacts)
+        self.contacts.append(record)
+        self.contact_ids.append(record.id)
+        self.add_position(self.first_names, record.first_name, position)
+        self.add_position(self.last_names, record.last_name, position)
+        for column in ("group_id", "birth_year", "birth_month", "birth_day"):
+            self.add_position(self.contact_index[column], getattr(record, column), position)
+        if record.birth_month is not None:
+            self.add_position(self.contact_index["birthday"], (record.birth_month, record.birth_day), position)
+
+
+    @staticmethod
+    def add_position(index, key, position):
+        """
+        Add position to the hash index (NULL keys are not indexed, same as they never match in sqlite)
+        """
+        if key is None:
+            return
+        positions = index.get(key)
+        if positions is None:
+            positions = index[key] = array.array("q")
+        positions.append(position)
+
+
+    def index_numbers(self):
+        """
+        Digits of all numbers in one string with a newline around every number → number patterns are found by str.find,
+        the number is found by bisect on offsets of the newline in front of every number
+        Exact numbers are searched by bisect on sorted numbers (a dict of millions of ints takes ten times more memory)
+        """
+        digits = [str(number) for number in self.numbers]
+        self.number_offsets = array.array("q", itertools.accumulate((len(text) + 1 for text in digits[:-1]), initial=0))
+        self.number_text = "\n" + "\n".join(digits) + "\n"
+        del digits
+        self.number_order = array.array("q", sorted(range(len(self.numbers)), key=self.numbers.__getitem__))
+        self.sorted_numbers = array.array("q", (self.numbers[position] for position in self.number_order))
+
+
+    def size(self, values):
+        """
+        Memory taken by the snapshot → containers, records, their ids and shared values (tables of groups and prefixes are left out)
+        Return: bytes
+        """
+        size = sys.getsizeof
+        total = size(self.contacts) + len(self.contacts) * size(ContactRecord((None,) * len(ContactRecord.__slots__)))
+        total += sum(map(size, values)) + sum(size(record.id) for record in self.contacts)
+        total += sum(map(size, (
+            self.contact_ids, self.number_ids, self.number_prefixes, self.numbers, self.number_contacts,
+            self.number_offsets, self.number_text, self.number_order, self.sorted_numbers,
+        )))
+        for index in (self.first_names, self.last_names, *self.contact_index.values(), *self.number_index.values()):
+            total += size(index) + sum(map(size, index.values()))
+        return total
+
+
+    def report(self):
+        """
+        Return: dict → number of contacts and phone numbers, memory in bytes (all of it and per contact), load time in seconds
+        """
+        return {
+            "contacts": len(self.contacts),
+            "numbers": len(self.numbers),
+            "bytes": self.memory,
+            "bytes_per_contact": round(self.memory / max(len(self.contacts), 1)),
+            "load_s": round(self.load_time, 3),
+        }
+
+
+    ##########
+    #  rows  #
+    ##########
+
+    def contact_row(self, position):
+        """
+        Return: listing row of the contact at given position
+        """
+        record = self.contacts[position]
+        return (
+            record.id, record.first_name, record.last_name, record.date_of_birth, self.groups.get(record.group_id),
+            record.street, record.number_of_descriptive, record.city
+        )
+
+
+    def number_row(self, position):
+        """
+        Return: listing row of the phone number at given position
+        """
+        prefix = self.prefixes.get(self.number_prefixes[position])
+        contact = self.contact_position(self.number_contacts[position])
+        if contact is None:
+            name = ""
+        else:
+            record = self.contacts[contact]
+            name = f"{record.first_name or ''} {record.last_name or ''}".strip()
+        return self.number_ids[position], prefix and f"+{prefix[0]}", self.numbers[position], name
+
+
+    def contact_position(self, contact_id):
+        """
+        Return: position of the contact with given id (None if it does not exist)
+        """
+        position = bisect.bisect_left(self.contact_ids, contact_id)
+        if position < len(self.contact_ids) and self.contact_ids[position] == contact_id:
+            return position
+        return None
+
+
+    def table_rows(self, table):
+        """
+        Return: stored rows of the table (columns of ContactDatabase.TABLES)
+        """
+        if table == "contact":
+            return [tuple(getattr(record, column) for column in ContactDatabase.COLUMNS[table]) for record in self.contacts]
+        if table == "phone_number":
+            return list(zip(
+                self.number_ids, (prefix or None for prefix in self.number_prefixes), self.numbers,
+                (contact or None for contact in self.number_contacts)
+            ))
+        if table == "contact_group":
+            return list(self.groups.items())
+        return [(prefix_id, prefix, state) for prefix_id, (prefix, state) in self.prefixes.items()]
+
+
+    def column_value(self, column, value):
+        """
+        Return: value converted like sqlite does for integer columns ('3' = 3)
+        """
+        if column in self.INTEGER_COLUMNS and isinstance(value, str) and value.lstrip("-").isdigit():
+            return int(value)
+        return value
+
+
+    #############
+    #  listing  #
+    #############
+
+    def listing(self, table, parameters: dict = None, operant="AND"):
+        """
+        Same rows as ContactDatabase.listing
+        Return: rows (empty list for unknown table or column)
+        """
+        if table not in ContactDatabase.LISTINGS:
+            return []
+        positions = self.positions(table, parameters or {}, operant)
+        if positions is None:
+            return []
+        if table == "contact":
+            return [self.contact_row(position) for position in positions]
+        if table == "phone_number":
+            return [self.number_row(position) for position in positions]
+        if table == "contact_group":
+            rows = list(self.groups.items())
+        else:
+            rows = [(prefix_id, f"+{prefix}", state) for prefix_id, (prefix, state) in self.prefixes.items()]
+        return [rows[position] for position in positions]
+
+
+    def positions(self, table, parameters, operant="AND"):
+        """
+        Positions of rows equal to parameters (date_of_birth → year, month or day) ordered by id
+        Indexed columns are looked up, the others are compared row by row
+        Return: positions (None for unknown column)
+        """
+        columns = ContactDatabase.COLUMNS[table]
+        if set(parameters) - set(columns):
+            return None
+        rows = None
+        indexes = self.contact_index if table == "contact" else self.number_index if table == "phone_number" else {}
+        if table == "contact":
+            indexes = {**indexes, "first_name": self.first_names, "last_name": self.last_names}
+        if not parameters:
+            return range(len(self.contacts if table == "contact" else self.numbers if table == "phone_number" else self.table_rows(table)))
+        found = []
+        for column, value in parameters.items():
+            if column == "date_of_birth":
+                parts = (int(part) if part else None for part in value[:3])
+                positions = set()
+                for part_column, part in zip(("birth_year", "birth_month", "birth_day"), parts):
+                    positions.update(self.contact_index[part_column].get(part, ()))
+            elif column in indexes:
+                positions = set(indexes[column].get(self.column_value(column, value), ()))
+            else:
+                rows = self.table_rows(table) if rows is None else rows
+                i = columns.index(column)
+                value = self.column_value(column, value)
+                positions = {position for position, row in enumerate(rows) if row[i] == value}
+            found.append(positions)
+        return sorted(set.union(*found) if operant == "OR" else set.intersection(*found))
+
+
+    def page(self, table, parameters: dict = None, operant="AND", after=None, before=None, size=PAGE_SIZE):
+        """
+        Same rows as ContactDatabase.page (rows of the page are looked up by bisect on ids)
+        """
+        if table not in ContactDatabase.LISTINGS:
+            return []
+        positions = self.positions(table, parameters or {}, operant)
+        if positions is None:
+            return []
+        ids = self.contact_ids if table == "contact" else self.number_ids if table == "phone_number" else None
+        if ids is None:
+            rows = self.listing(table, parameters, operant)
+            keys = [row[0] for row in rows]
+        else:
+            keys = [ids[position] for position in positions] if parameters else ids
+        if before is not None:
+            end = bisect.bisect_left(keys, before)
+            chosen = range(max(end - size, 0), end)
+        else:
+            start = bisect.bisect_right(keys, after if after is not None else -1)
+            chosen = range(start, min(start + size, len(keys)))
+        if ids is None:
+            return [rows[i] for i in chosen]
+        row = self.contact_row if table == "contact" else self.number_row
+        return [row(positions[i]) for i in chosen]
+
+
+    def select(self, table, parameters: dict, operant="AND", similar=False):
+        """
+        Same as ContactDatabase.select → rows equal to parameters, if there are none, rows containing them
+        Return: rows, valid, similar ("table" or "column", False, similar for unknown table or column)
+        """
+        if table not in ContactDatabase.TABLES:
+            return "table", False, similar
+        columns = ContactDatabase.COLUMNS[table]
+        if set(parameters) - set(columns):
+            return "column", False, similar
+        rows = self.table_rows(table)
+        if not similar:
+            positions = self.positions(table, parameters, operant)
+            if positions or not parameters:
+                return [rows[position] for position in positions], True, False
+        searched = [(columns.index(column), str(value).translate(self.LIKE_FOLD)) for column, value in parameters.items()]
+        join = any if operant == "OR" else all
+        data = [
+            row for row in rows
+            if join(row[i] is not None and value in str(row[i]).translate(self.LIKE_FOLD) for i, value in searched)
+        ]
+        return data, True, True
+
+
+    ###########
+    #  names  #
+    ###########
+
+    def group_name(self, group_id):
+        """
+        Return: name of the group (None if it does not exist)
+        """
+        return self.groups.get(group_id)
+
+
+    def group_id(self, name):
+        """
+        Return: id of the group with given name (None if it does not exist)
+        """
+        return self.group_ids.get(name)
+
+
+    def prefix(self, prefix_id):
+        """
+        Return: prefix with given id (None if it does not exist)
+        """
+        prefix = self.prefixes.get(prefix_id)
+        return prefix and prefix[0]
+
+
+    def prefix_id(self, prefix):
+        """
+        Return: id of the prefix (None if it does not exist)
+        """
+        return self.prefix_ids.get(prefix)
+
+
+    def exists(self, table, id_to_check):
+        """
+        Return: True if the row with given id exists
+        """
+        id_to_check = int(id_to_check)
+        if table == "contact":
+            return self.contact_position(id_to_check) is not None
+        if table == "phone_number":
+            position = bisect.bisect_left(self.number_ids, id_to_check)
+            return position < len(self.number_ids) and self.number_ids[position] == id_to_check
+        if table == "contact_group":
+            return id_to_check in self.groups
+        if table == "prefix":
+            return id_to_check in self.prefixes
+        return False
+
+
+    def statement_stats(self):
+        """
+        Return: [] → the snapshot does not execute any statement
+        """
+        return []
+
+
+    ############
+    #  search  #
+    ############
+
+    def search_name(self, name):
+        """
+        Same levels as ContactDatabase.search_name: equal first or last name → name contains given name →
+        names share trigrams with it, the last two are ranked by bm25 like the full-text index does it
+        Return: rows (same columns as listing), similar
+        """
+        exact = set(self.first_names.get(name, ())) | set(self.last_names.get(name, ()))
+        if exact:
+            return [self.contact_row(position) for position in sorted(exact)], False
+
+        trigrams = ContactDatabase.trigrams(name)
+        names = self.first_names.keys() | self.last_names.keys()
+        if not trigrams:
+            # too short for trigrams → all names containing it, same as LIKE (only ASCII letters are folded)
+            searched = name.translate(self.LIKE_FOLD)
+            positions = self.name_positions(n for n in names if searched in n.translate(self.LIKE_FOLD))
+            return [self.contact_row(position) for position in positions], True
+        terms = [name.lower()]
+        positions = self.name_positions(candidate for candidate in names if terms[0] in candidate.lower())
+        limit = None
+        if not positions:
+            # only typo candidates are limited, every name containing the searched one is returned
+            terms = sorted(trigrams)
+            positions = self.name_positions(candidate for candidate in names if trigrams & ContactDatabase.trigrams(candidate))
+            limit = ContactDatabase.SEARCH_LIMIT
+
+        searched = ContactDatabase.trigrams(name, fold=True)
+        rows = []
+        for position in self.rank_names(terms, positions)[:limit]:
+            record = self.contacts[position]
+            found = ContactDatabase.trigrams(record.first_name or "", fold=True) | ContactDatabase.trigrams(record.last_name or "", fold=True)
+            if len(searched & found) / len(searched) >= ContactDatabase.SEARCH_SIMILARITY:
+                rows.append(self.contact_row(position))
+        return rows, True
+
+
+    def rank_names(self, terms, positions):
+        """
+        Order contacts by bm25 of the trigram full-text index on first and last name,
+        so the best candidates are the same as in sqlite, contacts with the same names are scored once
+        Return: positions from the best match, same score → ordered by id
+        """
+        if self.name_tokens is None:
+            self.name_tokens = sum(
+                max(len(name) - 2, 0) * len(positions)
+                for index in (self.first_names, self.last_names) for name, positions in index.items()
+            )
+        average = self.name_tokens / max(len(self.contacts), 1)
+        counted = {}
+        hits = [0] * len(terms)
+        found = []
+        for position in positions:
+            record = self.contacts[position]
+            names = (record.first_name, record.last_name)
+            counts = counted.get(names)
+            if counts is None:
+                texts = [(text or "").lower() for text in names]
+                frequencies = tuple(sum(self.occurrences(text, term) for text in texts) for term in terms)
+                counts = counted[names] = frequencies, sum(max(len(text) - 2, 0) for text in texts)
+            for i, frequency in enumerate(counts[0]):
+                hits[i] += frequency > 0
+            found.append((position, counts))
+
+        documents = len(self.contacts)
+        idf = [max(math.log((documents - hit + 0.5) / (hit + 0.5)), 1e-6) for hit in hits]
+        scores = {}
+        for counts in counted.values():
+            frequencies, tokens = counts
+            scores[id(counts)] = sum(
+                weight * frequency * (self.BM25_K1 + 1) / (frequency + self.BM25_K1 * (1 - self.BM25_B + self.BM25_B * tokens / average))
+                for weight, frequency in zip(idf, frequencies)
+            )
+        found.sort(key=lambda item: (-scores[id(item[1])], self.contacts[item[0]].id))
+        return [position for position, _ in found]
+
+
+    @staticmethod
+    def occurrences(text, term):
+        """
+        Return: number of occurrences of the term in the text, overlapping ones included (like tokens of a phrase)
+        """
+        count = 0
+        start = text.find(term)
+        while start != -1:
+            count += 1
+            start = text.find(term, start + 1)
+        return count
+
+
+    def name_positions(self, names):
+        """
+        Return: positions of contacts with first or last name in names ordered by id
+        """
+        positions = set()
+        for name in names:
+            positions.update(self.first_names.get(name, ()))
+            positions.update(self.last_names.get(name, ()))
+        return sorted(positions)
+
+
+    def search_number(self, digits, mode="contains", prefix_id=None):
+        """
+        Same as ContactDatabase.search_number → contacts owning a phone number that contains, starts or ends with given digits
+        Return: rows (same columns as listing)
+        """
+        pattern = {"contains": digits, "starts": f"\n{digits}", "ends": f"{digits}\n"}[mode]
+        text = self.number_text
+        contacts = set()
+        offset = text.find(pattern)
+        while offset != -1:
+            position = bisect.bisect_right(self.number_offsets, offset) - 1
+            if prefix_id is None or self.number_prefixes[position] == prefix_id:
+                contacts.add(self.number_contacts[position])
+            if position + 1 == len(self.number_offsets):
+                break
+            offset = text.find(pattern, self.number_offsets[position + 1])
+        positions = (self.contact_position(contact_id) for contact_id in contacts if contact_id)
+        return [self.contact_row(position) for position in sorted(p for p in positions if p is not None)]
+
+
+    def contacts_by_numbers(self, numbers):
+        """
+        Same as ContactDatabase.contacts_by_numbers → owners of given phone numbers (exact match)
+        Return: dict → {number: rows (same columns as listing)}
+        """
+        found = {}
+        for number in numbers:
+            start = bisect.bisect_left(self.sorted_numbers, number)
+            end = bisect.bisect_right(self.sorted_numbers, number, start)
+            owners = (self.contact_position(self.number_contacts[self.number_order[i]]) for i in range(start, end))
+            found[number] = [self.contact_row(position) for position in sorted(p for p in owners if p is not None)]
+        return found
+
+
+    def upcoming_birthdays(self, days, today=None):
+        """
+        Same as ContactDatabase.upcoming_birthdays → contacts with birthday in the next given number of days (today included)
+        Return: rows (same columns as listing) ordered by the next birthday
+        """
+        today = today or datetime.date.today()
+        start = (today.month, today.day)
+        keys = list(self.contact_index["birthday"])
+        if days < 365:
+            last = today + datetime.timedelta(days=days)
+            end = (last.month, last.day)
+            if start <= end:
+                keys = [key for key in keys if start <= key <= end]
+            else:
+                keys = [key for key in keys if key >= start or key <= end]
+        keys.sort(key=lambda key: (key < start, key))
+        return [self.contact_row(position) for key in keys for position in self.contact_index["birthday"][key]]
+
+
+    def close(self):
+        pass
+
+
+###############
+#  Renderers  #
+###############
+
+class Renderer:
+    """
+    Write rows to the output in blocks → one write for many rows
+    """
+    BLOCK_ROWS = 1000
+
+    def __init__(self, header, keys=None, spaces="", widths=None):
+        self.header = list(header)
+        self.keys = list(keys) if keys else self.header
+        self.spaces = spaces
+        self.header_widths = widths
+
+
+    def write(self, rows, file=None):
+        file = file or sys.stdout
+        file.write(self.begin())
+        block = []
+        for row in rows:
+            block.append(self.line(row))
+            if len(block) >= self.BLOCK_ROWS:
+                file.write("".join(block))
+                block = []
+        block.append(self.end())
+        file.write("".join(block))
+
+
+    def begin(self):
+        return ""
+
+
+    def line(self, row):
+        raise NotImplementedError
+
+
+    def end(self):
+        return ""
+
+
+class TextRenderer(Renderer):
+    """
+    Table with columns aligned to the right,
+    widths are computed from a sample of rows and longer cells are shortened
+    """
+    SAMPLE_ROWS = 1000
+    MAX_WIDTH = 40
+
+    def write(self, rows, file=None):
+        rows = iter(rows)
+        sample = []
+        for row in rows:
+            sample.append(row)
+            if len(sample) >= self.SAMPLE_ROWS:
+                break
+        self.widths = list(self.header_widths or (len(f" {column} ") for column in self.header))
+        for row in sample:
+            for j, column in enumerate(row):
+                self.widths[j] = max(self.widths[j], len(self.cell(column)))
+        super().write(itertools.chain(sample, rows), file)
+
+
+    def cell(self, value):
+        value = "" if value is None else str(value)
+        if len(value) > self.MAX_WIDTH:
+            value = value[:self.MAX_WIDTH - 1] + "…"
+        return f" {value} "
+
+
+    def begin(self):
+        header = "".join(f"{column: >{width}}|" for column, width in zip((f" {c} " for c in self.header), self.widths))
+        return f"\n{self.spaces}|{header}\n{self.spaces}{'-' * (1 + sum(self.widths) + len(self.widths))}\n"
+
+
+    def line(self, row):
+        return f"{self.spaces}|" + "".join(f"{self.cell(column): >{width}}|" for column, width in zip(row, self.widths)) + "\n"
+
+
+class TsvRenderer(Renderer):
+    """
+    Tab separated values with header of column keys → for piping to other tools
+    """
+    def begin(self):
+        return "\t".join(self.keys) + "\n"
+
+
+    def line(self, row):
+        return "\t".join("" if column is None else str(column).replace("\t", " ").replace("\n", " ") for column in row) + "\n"
+
+
+class JsonRenderer(Renderer):
+    """
+    JSON array of objects with column keys
+    """
+    def begin(self):
+        self.first = True
+        return "["
+
+
+    def line(self, row):
+        separator = "\n" if self.first else ",\n"
+        self.first = False
+        return separator + json.dumps(dict(zip(self.keys, row)), ensure_ascii=False)
+
+
+    def end(self):
+        return "]\n" if self.first else "\n]\n"
+
+
+RENDERERS = {
+    "table": TextRenderer,
+    "tsv": TsvRenderer,
+    "json": JsonRenderer,
+}
+
+
+###########
+#  files  #
+###########
+
+def read_rows(path, file_format=None):
+    """
+    Stream rows (dicts) from csv or jsonl (ndjson) file
+    """
+    file_format = file_format or FILE_FORMATS.get(Path(path).suffix.lower(), "csv")
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_rows(file, columns, rows, file_format="csv"):
+    """
+    Write rows one by one to an opened file as csv or jsonl (ndjson)
+    Return: number of written rows
+    """
+    count = 0
+    if file_format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            file.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            file.write("\n")
+            count += 1
+    return count
+
+
+def export_file(arguments):
+    """
+    Command 'export' → write all rows of a table to a file (or standard output)
+    """
+    db = ContactDatabase(arguments.db, arguments.durability)
+    if arguments.table == "contact_view" and not db.contact_view:
+        db.close()
+        sys.exit("contact_view is turned off, turn it on by: dbapp.py view on")
+    file_format = "jsonl" if arguments.format == "ndjson" else arguments.format
+    if not file_format:
+        file_format = FILE_FORMATS.get(Path(arguments.output).suffix.lower(), "csv") if arguments.output else "csv"
+    rows = db.iter_listing(arguments.table, chunk_size=arguments.chunk_size, export=True)
+    columns = db.EXPORT_COLUMNS[arguments.table]
+    try:
+        if arguments.output:
+            with open(arguments.output, "w", newline="", encoding="utf-8") as file:
+                count = write_rows(file, columns, rows, file_format)
+            print(f"{count} rows exported")
+        else:
+            write_rows(sys.stdout, columns, rows, file_format)
+    finally:
+        rows.close()
+        db.close()
+
+
+def import_file(arguments):
+    """
+    Command 'import' → import rows from a file and report speed
+    """
+    db = ContactDatabase(arguments.db, arguments.durability)
+    start = time.perf_counter()
+    imported, rejected = db.import_rows(arguments.table, read_rows(arguments.file, arguments.format), arguments.batch_size)
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(f"{imported} rows imported, {rejected} rejected in {elapsed:.2f} s ({imported / max(elapsed, 1e-9):.0f} rows/s)")
+
+
+#################
+#  main script  #
+#################
+
+def parse_arguments(arguments=None):
+    """
+    Command line → no command starts the interactive application
+    """
+    parser = argparse.ArgumentParser(description="Contact database")
+    parser.add_argument("--db", help="path to the database file")
+    parser.add_argument("--durability", choices=DURABILITY_PROFILES, help=f"connection profile (default: {DURABILITY})")
+    parser.add_argument("--stats", action="store_true", help="collect statistics of executed statements, shown by 'l --stats'")
+    parser.add_argument("--slow-ms", type=float, help=f"statements slower than this are logged (default: {SLOW_QUERY_MS:g})")
+    parser.add_argument("--slow-log", help="append slow statements with their query plan to this file (json lines)")
+    parser.add_argument(
+        "--snapshot", action="store_true",
+        help="load the whole database into memory once and answer listings from it (read-only, memory is reported to standard error)"
+    )
+    parser.add_argument("--profile", action="store_true", help="print time of every stage of each command to standard error")
+    parser.add_argument(
+        "--profile-dump", metavar="FILE",
+        help=f"profile the whole run into pstats file or collapsed stacks ({', '.join(PROFILE_COLLAPSED)}), implies --profile"
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    importer = commands.add_parser("import", help="import rows from csv or jsonl file")
+    importer.add_argument("file")
+    importer.add_argument("-t", "--table", default="contact", choices=ContactDatabase.TABLES)
+    importer.add_argument("-f", "--format", choices=("csv", "jsonl"))
+    importer.add_argument("-b", "--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    exporter = commands.add_parser("export", help="export rows of a table to csv or jsonl file")
+    exporter.add_argument("table", choices=(*ContactDatabase.TABLES, "contact_view"))
+    exporter.add_argument("-f", "--format", choices=("csv", "jsonl", "ndjson"))
+    exporter.add_argument("-o", "--output", help="output file (default: standard output)")
+    exporter.add_argument("-c", "--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    view = commands.add_parser("view", help="turn on (or rebuild) or turn off contact_view, the read model of contact listings")
+    view.add_argument("state", choices=("on", "off"))
+
+    # parameters of list are the same as of the interactive 'l' → left for App.show
+    commands.add_parser("list", aliases=["l"], help="run one 'l' command, ex. list -g work --format json")
+
+    batch = commands.add_parser("batch", help="run commands from a file or standard input, one per line")
+    batch.add_argument("file", nargs="?", default="-", help="file with commands (default: standard input)")
+    batch.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="table", help="default output format")
+
+    arguments, parameters = parser.parse_known_args(arguments)
+    if arguments.command in ("list", "l"):
+        arguments.parameters = parameters
+    elif parameters:
+        parser.error(f"unrecognized arguments: {' '.join(parameters)}")
+    return arguments
+
+
+def query_stats(arguments):
+    """
+    Return: QueryStats with the slow query settings from the command line if statistics are wanted
+    (--stats, --slow-ms, --slow-log or profiling), otherwise None
+    """
+    wanted = arguments.stats or arguments.slow_ms is not None or arguments.slow_log
+    if not (QUERY_STATS or wanted or profiler(arguments)):
+        return None
+    return QueryStats(arguments.slow_ms, arguments.slow_log)
+
+
+def profiler(arguments):
+    """
+    Return: Profiler if profiling is wanted (--profile, --profile-dump or CONTACTDB_PROFILING), otherwise None
+    """
+    dump = arguments.profile_dump
+    environment = os.environ.get("CONTACTDB_PROFILING", "")
+    if not dump and environment not in ("", "0", "1"):
+        dump = environment
+    if arguments.profile or dump or environment == "1":
+        return Profiler(dump)
+    return None
+
+
+def report_snapshot(app):
+    """
+    Print size of the in-memory snapshot to standard error (nothing without --snapshot)
+    """
+    if not app._db.read_only:
+        return
+    report = app._db.report()
+    print(
+        f"snapshot: {report['contacts']} contacts, {report['numbers']} numbers, {report['bytes'] / 2**20:.1f} MB "
+        f"({report['bytes_per_contact']} B per contact) loaded in {report['load_s']:.2f} s",
+        file=sys.stderr
+    )
+
+
+def run_commands(arguments):
+    """
+    Run the 'list' command or the batch of commands over one connection without the interactive prompt
+    Return: exit code (1 if any command failed)
+    """
+    output_format = arguments.format if arguments.command == "batch" else "table"
+    app = App(LANGUAGE, arguments.db, arguments.durability, output_format, False, query_stats(arguments), arguments.snapshot)
+    report_snapshot(app)
+    profile = profiler(arguments)
+    if profile:
+        profile.attach(app)
+        profile.start()
+    try:
+        if arguments.command == "batch":
+            if arguments.file == "-":
+                failed = app.run_batch(sys.stdin)
+            else:
+                with open(arguments.file, encoding="utf-8") as file:
+                    failed = app.run_batch(file)
+        else:
+            failed = app.run_command("l", arguments.parameters)
+        sys.stdout.flush()
+    finally:
+        if profile:
+            profile.stop()
+        app.close()
+    return 1 if failed else 0
+
+
+def dispatch(arguments):
+    """
+    Run the command of the command line (none → the interactive application)
+    """
+    if arguments.command == "import":
+        import_file(arguments)
+        return
+    if arguments.command == "export":
+        export_file(arguments)
+        return
+    if arguments.command == "view":
+        db = ContactDatabase(arguments.db, arguments.durability)
+        if arguments.state == "on":
+            db.create_contact_view()
+        else:
+            db.drop_contact_view()
+        db.close()
+        return
+    if arguments.command in ("list", "l", "batch"):
+        sys.exit(run_commands(arguments))
+    app = App(LANGUAGE, arguments.db, arguments.durability, query_stats=query_stats(arguments), snapshot=arguments.snapshot)
+    report_snapshot(app)
+    profile = profiler(arguments)
+    if profile:
+        profile.attach(app)
+        profile.start()
+    try:
+        app.run()
+    finally:
+        if profile:
+            profile.stop()
+
 
 def main():
-    app = App(LANGUAGE)
-    app.run()
+    try:
+        dispatch(parse_arguments())
+    except BrokenPipeError:
+        # standard output closed early (ex. '| head') → no traceback, the flush at exit writes to devnull
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,970 @@
+"""
+Regression tests of ContactDatabase and ContactSnapshot on a small generated database (bench.py)
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import pstats
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import bench
+import dbapp
+
+CONTACTS = 2000
+
+
+@pytest.fixture(scope="module")
+def bench_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("bench") / "bench.db"
+    bench.create_database(path, CONTACTS)
+    return path
+
+
+@pytest.fixture
+def db(bench_db):
+    db = dbapp.ContactDatabase(bench_db)
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="module")
+def snapshot(bench_db):
+    return dbapp.ContactSnapshot(bench_db)
+
+
+def count(path, sql, values=()):
+    with contextlib.closing(sqlite3.connect(path)) as connection:
+        return connection.execute(sql, values).fetchone()[0]
+
+
+def queries(stats):
+    return sum(row[2] for row in stats.rows() if not row[1].startswith("PRAGMA"))
+
+
+def contact(first_name="Jana", last_name="Nová"):
+    return {"first_name": first_name, "last_name": last_name}
+
+
+#############
+#  listing  #
+#############
+
+def test_listing_joins_names_in_one_statement(tmp_path, capsys):
+    path = tmp_path / "contacts.db"
+    stats = dbapp.QueryStats()
+    db = dbapp.ContactDatabase(path, query_stats=stats)
+    try:
+        group = db.insert("contact_group", {"name": "kiosk"})
+        prefix = db.insert("prefix", {"prefix": 999, "state": "Testland"})
+        jana = db.insert("contact", {**contact(), "group_id": group, "date_of_birth": "1984-06-12"})
+        eva = db.insert("contact", contact("Eva", "Malá"))
+        number = db.insert("phone_number", {"prefix_id": prefix, "number": 777123456, "contact_id": jana})
+        stats.reset()
+        assert db.listing("contact") == [
+            (jana, "Jana", "Nová", "1984-06-12", "kiosk", None, None, None),
+            (eva, "Eva", "Malá", None, None, None, None, None),
+        ]
+        assert db.listing("phone_number") == [(number, "+999", 777123456, "Jana Nová")]
+        assert db.listing("prefix", {"id": prefix}) == [(prefix, "+999", "Testland")]
+        # three listings and one lookup of the optional tables
+        assert queries(stats) == 4
+        assert db.listing("contact", {"missing": 1}) == []
+        assert db.listing("missing") == []
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("parameters", [["-t", "contact"], ["-t", "number"], ["-g", "work"], ["-d", "1984//"]])
+def test_app_listing_costs_the_same_number_of_statements(bench_db, capsys, parameters):
+    stats = dbapp.QueryStats()
+    app = dbapp.App("en", bench_db, "balanced", "tsv", False, stats)
+    try:
+        stats.reset()
+        data = app.manage_option("l", parameters)
+    finally:
+        app.close()
+    assert data["valid"] and len(data["data"]) > 10
+    # listing (and group lookup), the first read also looks up the optional tables
+    assert queries(stats) <= 3
+
+
+@pytest.mark.parametrize("parameters", [None, {"group_id": 3}, {"date_of_birth": ["1984", "", ""]}])
+def test_pages_walk_the_whole_listing(db, parameters):
+    listing = db.listing("contact", parameters)
+    pages = [db.page("contact", parameters, size=70)]
+    while pages[-1]:
+        pages.append(db.page("contact", parameters, after=pages[-1][-1][0], size=70))
+    assert [row for page in pages for row in page] == listing
+    assert all(len(page) == 70 for page in pages[:-2])
+
+    backward = [db.page("contact", parameters, before=listing[-1][0] + 1, size=70)]
+    while backward[-1]:
+        backward.append(db.page("contact", parameters, before=backward[-1][0][0], size=70))
+    assert [row for page in reversed(backward) for row in page] == listing
+
+
+def test_page_seeks_by_primary_key(db):
+    with contextlib.closing(sqlite3.connect(db.db_path)) as connection:
+        plan = connection.execute(
+            f"EXPLAIN QUERY PLAN {db.listing_sql('contact')} WHERE contact.id > ? ORDER BY contact.id LIMIT ?;", (1500, 50)
+        ).fetchall()
+    assert "SEARCH contact USING INTEGER PRIMARY KEY (rowid>?)" in [row[3] for row in plan]
+
+
+def test_app_browses_pages(bench_db, db, capsys, monkeypatch):
+    answers = iter(["n", "n", "p", "x"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    app = dbapp.App("en", bench_db, "balanced", "tsv", True)
+    try:
+        data = app.manage_option("l", ["-t", "contact", "-p", "25"])
+    finally:
+        app.close()
+    assert data["data"] == db.listing("contact")[25:50]
+    ids = [line.split("\t")[0] for line in capsys.readouterr().out.splitlines() if line[:1].isdigit()]
+    expected = [str(row[0]) for row in db.listing("contact")]
+    assert ids == expected[:25] + expected[25:50] + expected[50:75] + expected[25:50]
+
+
+@pytest.mark.parametrize("size", ["0", "½", "x"])
+def test_app_refuses_wrong_page_size(tmp_path, capsys, size):
+    app = dbapp.App("en", tmp_path / "contacts.db", interactive=False)
+    try:
+        data = app.manage_option("l", ["-p", size])
+    finally:
+        app.close()
+    assert not data["valid"]
+    assert data["name"] == "not number"
+
+
+############
+#  search  #
+############
+
+def test_select_exact_then_similar_in_one_statement(bench_db):
+    stats = dbapp.QueryStats()
+    db = dbapp.ContactDatabase(bench_db, query_stats=stats)
+    try:
+        db.listing("prefix")
+        stats.reset()
+        rows, valid, similar = db.select("contact", {"first_name": "Tereza"})
+        assert valid and not similar
+        assert rows and all(row[1] == "Tereza" for row in rows)
+        rows, valid, similar = db.select("contact", {"first_name": "erez"})
+        assert valid and similar
+        assert len(rows) == count(bench_db, "SELECT COUNT(*) FROM contact WHERE first_name LIKE '%erez%'")
+        assert queries(stats) == 2
+
+        assert db.select("contact", {"first_name": "Tereza"}, similar=True)[0] == db.select("contact", {"first_name": "erez"})[0]
+        rows, _, similar = db.select("contact", {"first_name": "Tereza", "city": "Brno"}, "OR")
+        assert not similar
+        assert {row[0] for row in rows} == {
+            row[0] for row in db.listing("contact", {"first_name": "Tereza"}) + db.listing("contact", {"city": "Brno"})
+        }
+        assert db.search("contact", {"first_name": "xyzq"}) == []
+        assert db.select("missing", {}) == ("table", False, False)
+        assert db.select("contact", {"missing": 1}) == ("column", False, False)
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("parameters, statements", [
+    (["Tereza"], 1),
+    (["Terza"], 1),
+    (["-n", "61"], 1),
+    # group name lookup misses, then similar groups
+    (["-g", "wor"], 2),
+])
+def test_app_search_statements(bench_db, capsys, parameters, statements):
+    stats = dbapp.QueryStats()
+    app = dbapp.App("en", bench_db, "balanced", "tsv", False, stats)
+    try:
+        app._db.load_optional_tables()
+        stats.reset()
+        app.manage_option("l", parameters)
+    finally:
+        app.close()
+    assert queries(stats) == statements
+
+
+@pytest.mark.parametrize("name", ["nová", "Nová", "novák", "ová", "Ma"])
+def test_search_name_returns_every_contact_containing_name(bench_db, db, snapshot, name):
+    expected = count(bench_db, "SELECT COUNT(*) FROM contact WHERE first_name LIKE ? OR last_name LIKE ?", (f"%{name}%",) * 2)
+    assert expected > dbapp.ContactDatabase.SEARCH_LIMIT
+    for source in (db, snapshot):
+        rows, similar = source.search_name(name)
+        assert similar
+        assert len(rows) == expected
+
+
+def test_search_name_exact(bench_db, db, snapshot):
+    expected = count(bench_db, "SELECT COUNT(*) FROM contact WHERE first_name = 'Novák' OR last_name = 'Novák'")
+    for source in (db, snapshot):
+        rows, similar = source.search_name("Novák")
+        assert not similar
+        assert len(rows) == expected
+        assert all("Novák" in (row[1], row[2]) for row in rows)
+
+
+def test_search_name_limits_only_typos(db, snapshot):
+    for source in (db, snapshot):
+        rows, similar = source.search_name("Novk")
+        assert similar
+        assert 0 < len(rows) <= dbapp.ContactDatabase.SEARCH_LIMIT
+
+
+def test_number_search_after_name_ignores_prefix(bench_db, db, capsys):
+    app = dbapp.App("cz", bench_db, interactive=False)
+    try:
+        data = app.manage_option("l", ["Tereza", "-n", "61"])
+    finally:
+        app.close()
+    assert data["data"]
+    assert data["data"] == db.search_number("61")
+
+
+@pytest.mark.parametrize("number", ["+½", "½", "²", "*²", "+4²0"])
+def test_number_search_refuses_non_decimal_digits(tmp_path, capsys, number):
+    app = dbapp.App("en", tmp_path / "contacts.db", interactive=False)
+    try:
+        data = app.manage_option("l", ["-n", number])
+    finally:
+        app.close()
+    assert not data["valid"]
+    assert data["name"] == "not number"
+
+
+@pytest.mark.parametrize("option, value, name", [
+    ("-b", "½", "not number"),
+    ("-b", "²", "not number"),
+    ("-d", "½//", "non-numerical date"),
+    ("-d", "1984/²/", "non-numerical date"),
+])
+def test_birthday_and_date_refuse_non_decimal_digits(tmp_path, capsys, option, value, name):
+    app = dbapp.App("en", tmp_path / "contacts.db", interactive=False)
+    try:
+        data = app.manage_option("l", [option, value])
+    finally:
+        app.close()
+    assert not data["valid"]
+    assert data["name"] == name
+
+
+def test_date_filter_uses_only_given_parts(bench_db, db):
+    expected = count(bench_db, "SELECT COUNT(*) FROM contact WHERE strftime('%Y', date_of_birth) = '1984'")
+    assert len(db.listing("contact", {"date_of_birth": ["1984", "", ""]})) == expected
+    where, values = db.where_clause("contact", {"date_of_birth": ["1984", "", ""]})
+    assert values == (1984,)
+
+
+###########
+#  write  #
+###########
+
+QUOTED = ["O'Brien", "Robert'); DROP TABLE contact; --", 'say "hi"', "back\\slash"]
+
+
+def test_writes_bind_values_with_quotes(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    try:
+        ids = [db.insert("contact", contact(name, name)) for name in QUOTED]
+        assert [row[1:3] for row in db.listing("contact")] == [(name, name) for name in QUOTED]
+        assert db.update("contact", {"city": "L'Aquila"}, ids[0]) == 1
+        assert db.listing("contact", {"city": "L'Aquila"})[0][0] == ids[0]
+        assert db.delete("contact", ids[1]) == 1
+        assert len(db.listing("contact")) == len(QUOTED) - 1
+        assert db.insert("contact", {}) is not None
+        assert db.update("contact", {}, ids[0]) == 0
+        assert db.insert("missing", contact()) is None
+        assert db.insert("contact", {"missing": 1}) is None
+        assert db.update("contact", {"missing": 1}, ids[0]) is None
+        assert db.delete("missing", ids[0]) is None
+    finally:
+        db.close()
+
+
+def test_writes_reuse_one_statement_per_shape(tmp_path):
+    stats = dbapp.QueryStats()
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db", query_stats=stats)
+    try:
+        stats.reset()
+        for i in range(100):
+            db.insert("contact", contact(f"Jana{i}"))
+        assert db.write_statement("insert", "contact", ("first_name", "last_name")) is db.write_statement(
+            "insert", "contact", ("first_name", "last_name")
+        )
+        inserts = [row for row in stats.rows() if row[1].startswith("INSERT INTO contact ")]
+        assert [(row[1], row[2]) for row in inserts] == [("INSERT INTO contact (first_name, last_name) VALUES (?, ...);", 100)]
+    finally:
+        db.close()
+
+
+def test_many_writes(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    try:
+        rows = [contact(name) for name in QUOTED] + [{"first_name": "Eva", "city": "Brno"}, {"first_name": "Petr", "city": "Zlín"}]
+        assert db.insert_many("contact", iter(rows)) == len(rows)
+        ids = [row[0] for row in db.listing("contact")]
+        assert db.update_many("contact", [({"city": "Praha"}, ids[0]), ({"city": "Praha"}, ids[1]), ({}, ids[2]), ({"last_name": "Malá"}, ids[3])]) == 3
+        assert [row[0] for row in db.listing("contact", {"city": "Praha"})] == ids[:2]
+        assert db.delete_many("contact", iter(ids[:3])) == 3
+        assert [row[0] for row in db.listing("contact")] == ids[3:]
+
+        assert db.insert_many("contact", [contact("Ivana"), {"missing": 1}]) is None
+        assert db.update_many("contact", [({"missing": 1}, ids[3])]) is None
+        assert db.delete_many("missing", ids) is None
+        assert [row[0] for row in db.listing("contact")] == ids[3:]
+    finally:
+        db.close()
+
+
+################
+#  durability  #
+################
+
+PRAGMA_VALUES = {"WAL": "wal", "OFF": 0, "NORMAL": 1, "FULL": 2, "DEFAULT": 0, "MEMORY": 2}
+
+
+def pragmas(connection, names):
+    return {name: connection.execute(f"PRAGMA {name};").fetchone()[0] for name in names}
+
+
+@pytest.mark.parametrize("profile", list(dbapp.DURABILITY_PROFILES))
+def test_durability_profiles(tmp_path, profile):
+    expected = {name: PRAGMA_VALUES.get(value, value) for name, value in dbapp.DURABILITY_PROFILES[profile].items()}
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db", profile)
+    try:
+        assert db.settings() == expected
+        assert pragmas(db.pool.reader(), expected) == {**expected, "journal_mode": "wal"}
+    finally:
+        db.close()
+
+
+def test_durability_from_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONTACTDB_DURABILITY", "safe")
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    try:
+        assert db.durability == "safe"
+        assert db.settings()["synchronous"] == 2
+        db.configure({"synchronous": "OFF"})
+        assert pragmas(db.pool.reader(), ["synchronous"]) == {"synchronous": 0}
+        assert db.settings()["synchronous"] == 0
+    finally:
+        db.close()
+    assert dbapp.parse_arguments(["--durability", "bulk-load", "list"]).durability == "bulk-load"
+    with pytest.raises(ValueError):
+        dbapp.ContactDatabase(tmp_path / "contacts.db", "fast")
+
+
+###########
+#  exist  #
+###########
+
+def test_exists(bench_db, db):
+    number = db.listing("phone_number")[0][0]
+    for table, present in (("contact", CONTACTS), ("contact_group", 3), ("prefix", 1), ("phone_number", number)):
+        assert db.exists(table, present)
+        assert not db.exists(table, 10**9)
+    assert not db.exists("missing", 1)
+
+
+def test_existing_ids_in_chunks(bench_db):
+    stats = dbapp.QueryStats()
+    db = dbapp.ContactDatabase(bench_db, query_stats=stats)
+    try:
+        ids = list(range(CONTACTS - 1100, CONTACTS + 100))
+        stats.reset()
+        assert db.existing_ids("contact", iter(ids)) == set(range(CONTACTS - 1100, CONTACTS + 1))
+        probes = [row for row in stats.rows() if row[1].startswith("SELECT id FROM contact WHERE id IN")]
+        assert sum(row[2] for row in probes) == -(-len(ids) // db.EXIST_CHUNK_SIZE)
+        assert db.existing_ids("contact", []) == set()
+        assert db.existing_ids("missing", ids) == set()
+    finally:
+        db.close()
+
+
+###############
+#  renderers  #
+###############
+
+class CountingFile(io.StringIO):
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def render(renderer, rows, *header):
+    file = CountingFile()
+    renderer(header or ("id", "name"), spaces="  ").write(rows, file)
+    return file.getvalue()
+
+
+def test_text_renderer_aligns_and_shortens_cells():
+    rows = [(1, "Jana"), (10, None), (2, "x" * 50)]
+    lines = render(dbapp.TextRenderer, rows).splitlines()
+    long = " " + "x" * (dbapp.TextRenderer.MAX_WIDTH - 1) + "… "
+    assert lines == [
+        "",
+        f"  | id |{' name ': >{len(long)}}|",
+        "  " + "-" * (1 + 4 + len(long) + 2),
+        f"  |  1 |{' Jana ': >{len(long)}}|",
+        f"  | 10 |{'  ': >{len(long)}}|",
+        f"  |  2 |{long}|",
+    ]
+
+
+def test_tsv_and_json_renderers():
+    rows = [(1, "Ja\tna"), (2, None), (3, "line\nbreak")]
+    assert render(dbapp.TsvRenderer, rows) == "id\tname\n1\tJa na\n2\t\n3\tline break\n"
+    assert json.loads(render(dbapp.JsonRenderer, rows)) == [
+        {"id": 1, "name": "Ja\tna"}, {"id": 2, "name": None}, {"id": 3, "name": "line\nbreak"}
+    ]
+    assert json.loads(render(dbapp.JsonRenderer, [])) == []
+
+
+@pytest.mark.parametrize("renderer", list(dbapp.RENDERERS.values()))
+def test_renderers_write_in_blocks(renderer):
+    file = CountingFile()
+    renderer(("id", "name")).write(((i, "Jana") for i in range(2500)), file)
+    assert file.writes == 2 + 2500 // renderer.BLOCK_ROWS
+    assert file.getvalue().count("Jana") == 2500
+
+
+##############
+#  messages  #
+##############
+
+def test_message_catalogs_have_same_keys_and_columns():
+    catalogs = {language: builder() for language, builder in dbapp.MESSAGE_BUILDERS.items()}
+    cz, en = catalogs["cz"], catalogs["en"]
+    assert cz.keys() == en.keys()
+    for key, value in cz.items():
+        assert type(value) is type(en[key]), key
+        if isinstance(value, dict):
+            assert value.keys() == en[key].keys(), key
+            assert len(value["columns"]) == len(en[key]["columns"]), key
+
+
+@pytest.mark.parametrize("language", list(dbapp.MESSAGE_BUILDERS))
+def test_messages_are_built_once_with_widths(tmp_path, monkeypatch, language):
+    monkeypatch.setattr(dbapp, "MESSAGES", {})
+    messages = dbapp.load_messages(language)
+    assert dbapp.load_messages(language) is messages
+    for value in messages.values():
+        if isinstance(value, dict):
+            assert value["widths"] == tuple(len(f" {column} ") for column in value["columns"])
+    app = dbapp.App(language, str(tmp_path / "contacts.db"), "balanced", "table", False)
+    try:
+        assert app.messages is messages
+    finally:
+        app.close()
+
+
+################
+#  statistics  #
+################
+
+def test_statement_shape():
+    stats = dbapp.QueryStats()
+    shape = stats.shape("SELECT *\n  FROM contact WHERE id IN (?, ?,?)  AND group_id = ?;")
+    assert shape == "SELECT * FROM contact WHERE id IN (?, ...) AND group_id = ?;"
+    assert stats.shape("SELECT * FROM contact WHERE id IN (?, ?);") == stats.shape("SELECT * FROM contact WHERE id IN (?,?,?,?);")
+    assert dbapp.QueryStats.shape_id(shape) == dbapp.QueryStats.shape_id(stats.shape(shape))
+    assert len(dbapp.QueryStats.shape_id(shape)) == 8
+
+
+def test_statistics_rows_and_histogram():
+    stats = dbapp.QueryStats(slow_ms=1000)
+    with contextlib.closing(sqlite3.connect(":memory:")) as connection:
+        for elapsed in (0.00005, 0.005, 0.005, 2.0):
+            stats.record(connection, "SELECT 1;", None, 1, elapsed)
+        stats.record(connection, "SELECT 2;", None, 3, 0.0005)
+    first, second = stats.rows()
+    assert first[0] == dbapp.QueryStats.shape_id("SELECT 1;")
+    assert second[0] == dbapp.QueryStats.shape_id("SELECT 2;")
+    count, total_ms, _, max_ms, rows, slow, histogram = first[2:]
+    assert (count, total_ms, max_ms, rows, slow) == (4, 2010.05, 2000.0, 4, 1)
+    assert histogram == "<0.1ms:1 <10ms:2 >1000ms:1"
+    assert stats.summary() == {"queries": 5, "total_ms": 2010.55, "slow": 1, "slow_ms": 1000}
+    stats.reset()
+    assert stats.rows() == [] and not stats.slow
+
+
+def test_slow_log_has_plan(tmp_path):
+    log = tmp_path / "slow.jsonl"
+    stats = dbapp.QueryStats(slow_ms=0, slow_log=log)
+    sql = "SELECT * FROM contact WHERE id IN (?, ?);"
+    with contextlib.closing(sqlite3.connect(":memory:")) as connection:
+        connection.execute("CREATE TABLE contact (id INTEGER PRIMARY KEY, name TEXT);")
+        stats.record(connection, sql, (1, 2), 0, 0.001)
+    [entry] = map(json.loads, log.read_text(encoding="utf-8").splitlines())
+    assert entry["statement"] == "SELECT * FROM contact WHERE id IN (?, ...);"
+    assert entry["id"] == dbapp.QueryStats.shape_id(entry["statement"])
+    assert entry["parameters"] == [1, 2]
+    assert entry["plan"] and "contact" in entry["plan"][0]
+    assert list(stats.slow) == [entry]
+
+
+def test_statistics_are_off_by_default(monkeypatch):
+    monkeypatch.delenv("CONTACTDB_PROFILING", raising=False)
+    assert dbapp.query_stats(dbapp.parse_arguments([])) is None
+    assert isinstance(dbapp.query_stats(dbapp.parse_arguments(["--stats"])), dbapp.QueryStats)
+    assert dbapp.query_stats(dbapp.parse_arguments(["--slow-ms", "5"])).slow_ms == 5
+
+
+@pytest.mark.parametrize("query_stats", [None, dbapp.QueryStats()])
+def test_app_shows_statistics(bench_db, capsys, query_stats):
+    app = dbapp.App("en", bench_db, "balanced", "tsv", False, query_stats)
+    try:
+        app.manage_option("l", ["-g", "work"])
+        capsys.readouterr()
+        app.manage_option("l", ["--stats"])
+    finally:
+        app.close()
+    lines = [line for line in capsys.readouterr().out.splitlines() if line]
+    if query_stats is None:
+        assert lines == [app.messages["no stats"]]
+    else:
+        assert lines[0].split("\t") == list(dbapp.QueryStats.COLUMNS)
+        assert any("contact_group" in line for line in lines[1:])
+
+
+############
+#  caches  #
+############
+
+def test_caches_see_writes_of_other_instance(tmp_path):
+    path = tmp_path / "contacts.db"
+    writer = dbapp.ContactDatabase(path)
+    reader = dbapp.ContactDatabase(path)
+    try:
+        assert reader.listing("contact") == []
+        assert reader.group_id("kiosk") is None
+
+        writer.insert("contact", contact())
+        writer.insert("contact_group", {"name": "kiosk"})
+        assert [row[1:3] for row in reader.listing("contact")] == [("Jana", "Nová")]
+        assert reader.group_id("kiosk") == writer.group_id("kiosk") is not None
+
+        writer.update("contact", contact("Eva"), reader.listing("contact")[0][0])
+        assert [row[1:3] for row in reader.listing("contact")] == [("Eva", "Nová")]
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_read_does_not_wait_for_running_write(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    rows = []
+    try:
+        db.insert("contact", contact())
+        with db.writing("contact") as cursor:
+            cursor.execute("INSERT INTO contact (first_name) VALUES ('Eva');")
+            thread = threading.Thread(target=lambda: rows.extend(db.listing("contact")))
+            thread.start()
+            thread.join(timeout=1)
+            assert not thread.is_alive()
+        assert [row[1] for row in rows] == ["Jana"]
+        assert [row[1] for row in db.listing("contact")] == ["Jana", "Eva"]
+    finally:
+        db.close()
+
+
+def test_data_version_check_is_not_in_statistics(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db", query_stats=dbapp.QueryStats())
+    try:
+        db.listing("contact")
+        db.group_id("kiosk")
+        assert db.statement_stats()
+        assert not any("data_version" in str(row) for row in db.statement_stats())
+    finally:
+        db.close()
+
+
+################
+#  connection  #
+################
+
+def test_close_removes_journal_files(tmp_path):
+    path = tmp_path / "contacts.db"
+    db = dbapp.ContactDatabase(path)
+    assert db.import_rows("contact", iter([contact()] * 3)) == (3, 0)
+    db.listing("contact")
+    db.close()
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["contacts.db"]
+
+
+def without_fts5(monkeypatch):
+    monkeypatch.setattr(dbapp.ContactDatabase, "NAME_SEARCH", ["CREATE VIRTUAL TABLE contact_search USING missing_module(first_name);"])
+    monkeypatch.setattr(dbapp.ContactDatabase, "fts5_available", staticmethod(lambda: False))
+
+
+def test_skipped_full_text_migration_is_not_retried_without_fts5(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.db"
+    without_fts5(monkeypatch)
+    db = dbapp.ContactDatabase(path)
+    assert not db.name_search
+    assert db.schema_state() == (len(db.MIGRATIONS), True)
+    db.insert("contact", contact())
+    db.close()
+
+    migrations = []
+    monkeypatch.setattr(dbapp.ContactDatabase, "create_tables", lambda self: migrations.append("create_tables"))
+    db = dbapp.ContactDatabase(path)
+    try:
+        assert migrations == []
+        rows, _ = db.search_name("nová")
+        assert [row[1:3] for row in rows] == [("Jana", "Nová")]
+    finally:
+        db.close()
+
+
+def test_skipped_full_text_migration_runs_with_fts5(tmp_path, monkeypatch):
+    path = tmp_path / "contacts.db"
+    without_fts5(monkeypatch)
+    db = dbapp.ContactDatabase(path)
+    db.insert("contact", contact())
+    db.close()
+
+    monkeypatch.undo()
+    db = dbapp.ContactDatabase(path)
+    try:
+        assert db.name_search
+        assert db.schema_state() == (len(db.MIGRATIONS), False)
+        rows, _ = db.search_name("nová")
+        assert [row[1:3] for row in rows] == [("Jana", "Nová")]
+    finally:
+        db.close()
+
+
+def test_reader_connections_close_with_their_threads(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    try:
+        db.insert("contact", contact())
+        db.listing("contact")
+        readers = len(db.pool.readers)
+        cursors = len(db.pool.cursors)
+        for _ in range(50):
+            thread = threading.Thread(target=db.listing, args=("contact",))
+            thread.start()
+            thread.join()
+        assert len(db.pool.readers) == readers
+        assert len(db.pool.cursors) == cursors
+    finally:
+        db.close()
+
+
+def test_threads_read_while_other_threads_write(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    errors = []
+
+    def work(number):
+        try:
+            for i in range(20):
+                db.insert("contact", contact(f"Jana{number}", f"Nová{i}"))
+                assert len(db.listing("contact", {"first_name": f"Jana{number}"})) == i + 1
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work, args=(number,)) for number in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert len(db.listing("contact")) == 8 * 20
+    finally:
+        db.close()
+
+
+############
+#  import  #
+############
+
+@pytest.mark.parametrize("file_format", ["csv", "jsonl"])
+def test_export_import_round_trip(bench_db, db, tmp_path, capsys, file_format):
+    copy = tmp_path / "copy.db"
+    for table in ("contact_group", "prefix", "contact", "phone_number"):
+        path = tmp_path / f"{table}.{file_format}"
+        dbapp.export_file(dbapp.parse_arguments(["--db", str(bench_db), "export", table, "-o", str(path)]))
+        dbapp.import_file(dbapp.parse_arguments(["--db", str(copy), "import", str(path), "-t", table]))
+    imported = dbapp.ContactDatabase(copy)
+    try:
+        for table in ("contact_group", "prefix", "contact", "phone_number"):
+            assert imported.listing(table) == db.listing(table)
+        assert imported.listing("phone_number", {"contact_id": 7}) == db.listing("phone_number", {"contact_id": 7})
+    finally:
+        imported.close()
+
+
+def test_import_rejects_invalid_rows(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    rows = [
+        {"first_name": "Jana", "group": "work", "date_of_birth": "1984-06-12"},
+        {"first_name": "Eva", "group": "missing"},
+        {"first_name": "Petr", "date_of_birth": "12. 6. 1984"},
+        {"first_name": "Pavel", "group_id": "3", "number_of_descriptive": "x"},
+        {"id": "1", "first_name": "Duplicate"},
+    ]
+    try:
+        assert db.import_rows("contact", iter(rows), batch_size=2) == (1, 4)
+        assert [row[1:5] for row in db.listing("contact")] == [("Jana", None, "1984-06-12", "work")]
+        numbers = [{"prefix": "+420", "number": "777123456", "contact_id": "1"}, {"prefix": "+1", "number": "1"}, {"number": "2", "prefix_id": "9"}]
+        db.insert("prefix", {"prefix": 420, "state": "Česko"})
+        assert db.import_rows("phone_number", iter(numbers)) == (1, 2)
+    finally:
+        db.close()
+
+
+##################
+#  contact view  #
+##################
+
+def joined_listing(db, table):
+    with contextlib.closing(sqlite3.connect(db.db_path)) as connection:
+        return connection.execute(f"{db.LISTINGS[table]} ORDER BY {table}.id;").fetchall()
+
+
+def test_contact_view_follows_writes(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    try:
+        group = db.insert("contact_group", {"name": "kiosk"})
+        prefix = db.insert("prefix", {"prefix": 999, "state": "Testland"})
+        jana = db.insert("contact", {**contact(), "group_id": group, "date_of_birth": "1984-06-12"})
+        eva = db.insert("contact", contact("Eva", "Malá"))
+        db.insert("phone_number", {"prefix_id": prefix, "number": 777123456, "contact_id": jana})
+        db.create_contact_view()
+        writes = [
+            lambda: db.insert("phone_number", {"prefix_id": prefix, "number": 603000111, "contact_id": eva}),
+            lambda: db.insert("phone_number", {"prefix_id": prefix, "number": 603000222, "contact_id": jana}),
+            lambda: db.update("contact_group", {"name": "booth"}, group),
+            lambda: db.update("prefix", {"prefix": 998}, prefix),
+            lambda: db.update("contact", {"last_name": "Nováková", "date_of_birth": "1985-01-02"}, jana),
+            lambda: db.update("phone_number", {"contact_id": eva}, db.listing("phone_number")[0][0]),
+            lambda: db.delete("phone_number", db.listing("phone_number")[-1][0]),
+            lambda: db.delete("contact_group", group),
+            lambda: db.delete("contact", eva),
+        ]
+        for write in writes:
+            write()
+            kept = db.listing("contact_view")
+            assert db.listing("contact") == joined_listing(db, "contact")
+            assert db.listing("phone_number") == joined_listing(db, "phone_number")
+            db.create_contact_view()
+            assert db.listing("contact_view") == kept
+        assert db.listing("contact_view") == [(jana, "Jana Nováková", "1985-01-02", None, None, None, None, None)]
+    finally:
+        db.close()
+
+
+def test_rebuild_indexes_of_contact_view(tmp_path):
+    db = dbapp.ContactDatabase(tmp_path / "contacts.db")
+    try:
+        assert db.rebuild_indexes("idx_contact_last_name")
+        assert not db.rebuild_indexes("idx_contact_view_last_name")
+        db.create_contact_view()
+        assert db.rebuild_indexes("idx_contact_view_last_name")
+        assert db.rebuild_indexes()
+        assert not db.rebuild_indexes("idx_missing")
+    finally:
+        db.close()
+
+
+###########
+#  async  #
+###########
+
+def test_async_number_lookups_are_one_query(bench_db, db):
+    numbers = [row[2] for row in db.listing("phone_number")[:40:4]] + [1]
+    calls = []
+
+    async def lookup():
+        async with dbapp.AsyncContactDatabase(bench_db, workers=2) as facade:
+            contacts_by_numbers = facade.db.contacts_by_numbers
+            facade.db.contacts_by_numbers = lambda numbers: calls.append(numbers) or contacts_by_numbers(numbers)
+            found = await asyncio.gather(*(facade.find_by_number(number) for number in numbers))
+            listing = await facade.listing("contact", {"group_id": 3})
+        return found, listing
+
+    found, listing = asyncio.run(lookup())
+    expected = db.contacts_by_numbers(numbers)
+    assert len(calls) == 1
+    assert sorted(calls[0]) == sorted(numbers)
+    assert found == [expected[number] for number in numbers]
+    assert found[-1] == []
+    assert listing == db.listing("contact", {"group_id": 3})
+
+
+def test_import_does_not_load_asyncio():
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, dbapp; print('asyncio' in sys.modules, 'concurrent.futures' in sys.modules)"],
+        capture_output=True, text=True, cwd=dbapp.Path(dbapp.__file__).parent
+    )
+    assert result.stdout.split() == ["False", "False"]
+
+
+#########
+#  CLI  #
+#########
+
+def run_cli(*arguments, stdin=""):
+    return subprocess.run(
+        [sys.executable, dbapp.__file__, *map(str, arguments)], input=stdin, capture_output=True, text=True, encoding="utf-8"
+    )
+
+
+def test_list_command(bench_db):
+    result = run_cli("--db", bench_db, "list", "-g", "work", "-f", "tsv")
+    lines = [line for line in result.stdout.splitlines() if line]
+    assert result.returncode == 0
+    assert lines[0].split("\t")[0] == "id"
+    assert len(lines) - 1 == count(bench_db, "SELECT COUNT(*) FROM contact JOIN contact_group ON contact_group.id = group_id WHERE name = 'work'")
+    assert run_cli("--db", bench_db, "list", "-n", "x").returncode == 1
+
+
+def test_batch_counts_failed_commands(bench_db):
+    result = run_cli("--db", bench_db, "batch", "-f", "tsv", stdin="# comment\n\nl -t prefix\ni\nl -n x\nl -t group\n")
+    assert result.returncode == 1
+    assert result.stdout.count("id\t") == 2
+
+
+def test_batch_command_error_fails_only_that_command(tmp_path, capsys, monkeypatch):
+    app = dbapp.App("en", tmp_path / "contacts.db", "balanced", "tsv", False)
+    calls = []
+
+    def fail(*arguments):
+        calls.append(arguments)
+        raise sqlite3.OperationalError("disk I/O error")
+
+    try:
+        monkeypatch.setattr(app._db, "upcoming_birthdays", fail)
+        assert app.run_batch(["l -t prefix", "l -b 7", "l -t group"]) == 1
+    finally:
+        app.close()
+    output = capsys.readouterr()
+    assert calls
+    assert output.out.count("id\t") == 2
+    assert "'l -b 7'" in output.err and "disk I/O error" in output.err
+
+
+@pytest.mark.parametrize("command", [("export", "contact"), ("list", "-t", "contact"), ("batch",)])
+def test_closed_standard_output_exits_quietly(bench_db, command):
+    process = subprocess.Popen(
+        [sys.executable, dbapp.__file__, "--db", str(bench_db), *command],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    process.stdin.write(b"l -t contact\n" * 5)
+    process.stdin.close()
+    process.stdout.readline()
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.stderr.close()
+    assert process.wait() == 1
+    assert stderr == b""
+
+
+###############
+#  profiling  #
+###############
+
+def test_profiler_reports_stages_of_commands(bench_db):
+    file = io.StringIO()
+    profiler = dbapp.Profiler(file=file)
+    app = dbapp.App("en", bench_db, "balanced", "tsv", False, dbapp.QueryStats())
+    try:
+        profiler.attach(app)
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.manage_option("l", ["-g", "work"])
+            app.manage_option("l", ["-t", "prefix"])
+    finally:
+        profiler.stop()
+        app.close()
+    lines = file.getvalue().splitlines()
+    assert lines[0].startswith("profile: l -g work | total ")
+    assert "mode_group" in lines[0] and "print_table" in lines[0]
+    assert lines[1].startswith("profile: l -t prefix | total ")
+    totals = {line.split()[1]: int(line.split()[2]) for line in lines[3:]}
+    assert totals["total"] == totals["db"] == totals["render"] == 2
+    assert totals["mode_group"] == totals["mode_table"] == 1
+
+
+@pytest.mark.parametrize("dump", ["run.prof", "run.folded"])
+def test_profile_dump(bench_db, tmp_path, dump):
+    path = tmp_path / dump
+    result = run_cli("--db", bench_db, "--profile-dump", path, "list", "-g", "work", "-f", "tsv")
+    assert result.returncode == 0
+    assert result.stderr.startswith("profile: l -g work -f tsv | total ")
+    if path.suffix == ".prof":
+        assert pstats.Stats(str(path)).total_calls > 0
+    else:
+        stacks = path.read_text(encoding="utf-8").splitlines()
+        assert stacks and all(line.rsplit(" ", 1)[1].isdecimal() for line in stacks)
+        assert any("dbapp:App.mode_group" in line for line in stacks)
+
+
+##############
+#  snapshot  #
+##############
+
+@pytest.mark.parametrize("method, arguments", [
+    ("listing", ("contact",)),
+    ("listing", ("phone_number",)),
+    ("listing", ("prefix",)),
+    ("listing", ("contact_group",)),
+    ("listing", ("contact", {"group_id": 3})),
+    ("listing", ("contact", {"date_of_birth": ["1984", "", ""]})),
+    ("listing", ("contact", {"date_of_birth": ["", "06", "12"]})),
+    ("listing", ("phone_number", {"prefix_id": 1})),
+    ("page", ("contact", None, "AND", 100)),
+    ("page", ("contact", None, "AND", None, 100)),
+    ("page", ("contact", {"group_id": 2}, "AND", 500, None, 7)),
+    ("search_name", ("Tereza",)),
+    ("search_name", ("nová",)),
+    ("search_name", ("Novk",)),
+    ("search_name", ("Dvorak",)),
+    ("search_name", ("Pavla",)),
+    ("search_name", ("xyzq",)),
+    ("search_name", ("č",)),
+    ("search_name", ("Č",)),
+    ("search_name", ("ŘÍ",)),
+    ("select", ("contact", {"city": "ÚS"}, "AND", True)),
+    ("select", ("contact", {"last_name": "ová", "city": "ústí"}, "OR", True)),
+    ("search_number", ("615",)),
+    ("search_number", ("61", "starts")),
+    ("search_number", ("93", "ends")),
+    ("search_number", ("6", "contains", 1)),
+    ("upcoming_birthdays", (30, datetime.date(2026, 12, 20))),
+    ("upcoming_birthdays", (400, datetime.date(2024, 2, 29))),
+    ("select", ("prefix", {"prefix": "42"}, "AND", True)),
+    ("select", ("contact_group", {"name": "wor"}, "AND", True)),
+])
+def test_snapshot_returns_same_rows_as_database(db, snapshot, method, arguments):
+    assert getattr(snapshot, method)(*arguments) == getattr(db, method)(*arguments)
+
+
+def test_snapshot_sees_rows_committed_only_to_wal(tmp_path):
+    path = tmp_path / "contacts.db"
+    db = dbapp.ContactDatabase(path)
+    try:
+        db.pool.configure({"wal_autocheckpoint": 0})
+        db.insert("contact", contact())
+        assert (tmp_path / "contacts.db-wal").stat().st_size
+        assert dbapp.ContactSnapshot(path).listing("contact") == db.listing("contact")
+    finally:
+        db.close()
+
+
+def test_snapshot_refuses_writes(bench_db, capsys):
+    app = dbapp.App("en", bench_db, interactive=False, snapshot=True)
+    for option in ("i", "u", "d"):
+        app.manage_option(option, [])
+    assert capsys.readouterr().out.count("read-only") == 3